@@ -10,7 +10,6 @@ from typing import Any, Dict, List, Optional
 from agentpress.tool import Tool, ToolResult, openapi_schema, xml_schema, ToolSchema, SchemaType
 from mcp_local.client import MCPManager
 from utils.logger import logger
-import inspect
 from mcp import ClientSession
 from mcp.client.sse import sse_client
 from mcp.client.stdio import stdio_client
@@ -448,11 +447,8 @@ class MCPToolWrapper(Tool):
     
     def _register_schemas(self):
         """Register schemas from all decorated methods and dynamic tools."""
-        # First register static schemas from decorated methods
-        for name, method in inspect.getmembers(self, predicate=inspect.ismethod):
-            if hasattr(method, 'tool_schemas'):
-                self._schemas[name] = method.tool_schemas
-                logger.debug(f"Registered schemas for method '{name}' in {self.__class__.__name__}")
+        # First register static schemas from decorated methods (collected once per class)
+        self._schemas.update(self._class_schemas)
         
         # Note: Dynamic schemas will be added after async initialization
         logger.debug(f"Initial registration complete for MCPToolWrapper")
@@ -1,6 +1,7 @@
 import os
 import base64
-import mimetypes
+import asyncio
+from collections import OrderedDict
 from typing import Optional, Tuple
 from io import BytesIO
 from PIL import Image
@@ -10,12 +11,14 @@ from sandbox.tool_base import SandboxToolsBase
 from agentpress.thread_manager import ThreadManager
 import json
 
-# Add common image MIME types if mimetypes module is limited
-mimetypes.add_type("image/webp", ".webp")
-mimetypes.add_type("image/jpeg", ".jpg")
-mimetypes.add_type("image/jpeg", ".jpeg")
-mimetypes.add_type("image/png", ".png")
-mimetypes.add_type("image/gif", ".gif")
+# Supported image formats, keyed by lowercase file extension
+_EXT_TO_MIME = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+}
 
 # Maximum file size in bytes (e.g., 10MB for original, 5MB for compressed)
 MAX_IMAGE_SIZE = 10 * 1024 * 1024
@@ -27,6 +30,9 @@ DEFAULT_MAX_HEIGHT = 1080
 DEFAULT_JPEG_QUALITY = 85
 DEFAULT_PNG_COMPRESS_LEVEL = 6
 
+# Total base64 size of encoded images kept per tool instance for repeated see_image calls
+ENCODED_IMAGE_CACHE_MAX_BYTES = 10 * 1024 * 1024
+
 class SandboxVisionTool(SandboxToolsBase):
     """Tool for allowing the agent to 'see' images within the sandbox."""
 
@@ -35,6 +41,9 @@ class SandboxVisionTool(SandboxToolsBase):
         self.thread_id = thread_id
         # Make thread_manager accessible within the tool instance
         self.thread_manager = thread_manager
+        # (full_path, mod_time, size) -> (mime_type, base64, compressed_size)
+        self._encoded_images: "OrderedDict[Tuple[str, Optional[str], int], Tuple[str, str, int]]" = OrderedDict()
+        self._encoded_images_bytes = 0
 
     def compress_image(self, image_bytes: bytes, mime_type: str, file_path: str) -> Tuple[bytes, str]:
         """Compress an image to reduce its size while maintaining reasonable quality.
@@ -143,51 +152,67 @@ class SandboxVisionTool(SandboxToolsBase):
 
             # Check if file exists and get info
             try:
-                file_info = self.sandbox.fs.get_file_info(full_path)
+                file_info = await asyncio.to_thread(self.sandbox.fs.get_file_info, full_path)
                 if file_info.is_dir:
                     return self.fail_response(f"Path '{cleaned_path}' is a directory, not an image file.")
             except Exception as e:
                 return self.fail_response(f"Image file not found at path: '{cleaned_path}'")
 
-            # Check file size
-            if file_info.size > MAX_IMAGE_SIZE:
-                return self.fail_response(f"Image file '{cleaned_path}' is too large ({file_info.size / (1024*1024):.2f}MB). Maximum size is {MAX_IMAGE_SIZE / (1024*1024)}MB.")
-
-            # Read image file content
-            try:
-                image_bytes = self.sandbox.fs.download_file(full_path)
-            except Exception as e:
-                return self.fail_response(f"Could not read image file: {cleaned_path}")
+            # Check file size before downloading anything
+            size = file_info.size
+            if size == 0:
+                return self.fail_response(f"Image file '{cleaned_path}' is empty.")
+            if size > MAX_IMAGE_SIZE:
+                return self.fail_response(f"Image file '{cleaned_path}' is too large ({size / (1024*1024):.2f}MB). Maximum size is {MAX_IMAGE_SIZE / (1024*1024)}MB.")
 
             # Determine MIME type
-            mime_type, _ = mimetypes.guess_type(full_path)
-            if not mime_type or not mime_type.startswith('image/'):
-                # Basic fallback based on extension if mimetypes fails
-                ext = os.path.splitext(cleaned_path)[1].lower()
-                if ext == '.jpg' or ext == '.jpeg': mime_type = 'image/jpeg'
-                elif ext == '.png': mime_type = 'image/png'
-                elif ext == '.gif': mime_type = 'image/gif'
-                elif ext == '.webp': mime_type = 'image/webp'
-                else:
-                    return self.fail_response(f"Unsupported or unknown image format for file: '{cleaned_path}'. Supported: JPG, PNG, GIF, WEBP.")
-
-            # Compress the image
-            compressed_bytes, compressed_mime_type = self.compress_image(image_bytes, mime_type, cleaned_path)
-            
-            # Check if compressed image is still too large
-            if len(compressed_bytes) > MAX_COMPRESSED_SIZE:
-                return self.fail_response(f"Image file '{cleaned_path}' is still too large after compression ({len(compressed_bytes) / (1024*1024):.2f}MB). Maximum compressed size is {MAX_COMPRESSED_SIZE / (1024*1024)}MB.")
-
-            # Convert to base64
-            base64_image = base64.b64encode(compressed_bytes).decode('utf-8')
+            ext = os.path.splitext(cleaned_path)[1].lower()
+            mime_type = _EXT_TO_MIME.get(ext)
+            if mime_type is None:
+                return self.fail_response(f"Unsupported or unknown image format for file: '{cleaned_path}'. Supported: JPG, PNG, GIF, WEBP.")
+
+            # Reuse the encoding if this exact file version was already seen
+            cache_key = (full_path, getattr(file_info, 'mod_time', None), size)
+            cached = self._encoded_images.get(cache_key)
+            if cached:
+                self._encoded_images.move_to_end(cache_key)
+                compressed_mime_type, base64_image, compressed_size = cached
+            else:
+                # Read image file content
+                try:
+                    image_bytes = await asyncio.to_thread(self.sandbox.fs.download_file, full_path)
+                except Exception as e:
+                    return self.fail_response(f"Could not read image file: {cleaned_path}")
+
+                # Compress the image
+                compressed_bytes, compressed_mime_type = self.compress_image(image_bytes, mime_type, cleaned_path)
+                # The original download is no longer needed; release it before encoding
+                del image_bytes
+                
+                # Check if compressed image is still too large
+                compressed_size = len(compressed_bytes)
+                if compressed_size > MAX_COMPRESSED_SIZE:
+                    return self.fail_response(f"Image file '{cleaned_path}' is still too large after compression ({compressed_size / (1024*1024):.2f}MB). Maximum compressed size is {MAX_COMPRESSED_SIZE / (1024*1024)}MB.")
+
+                # Convert to base64 (the output alphabet is pure ASCII, so skip UTF-8 validation)
+                base64_image = base64.b64encode(compressed_bytes).decode('ascii')
+                del compressed_bytes
+
+                # Bound the cache by the size of the base64 strings it holds, not by entry count
+                if len(base64_image) <= ENCODED_IMAGE_CACHE_MAX_BYTES:
+                    self._encoded_images[cache_key] = (compressed_mime_type, base64_image, compressed_size)
+                    self._encoded_images_bytes += len(base64_image)
+                    while self._encoded_images_bytes > ENCODED_IMAGE_CACHE_MAX_BYTES:
+                        _, (_, evicted, _) = self._encoded_images.popitem(last=False)
+                        self._encoded_images_bytes -= len(evicted)
 
             # Prepare the temporary message content
             image_context_data = {
                 "mime_type": compressed_mime_type,
                 "base64": base64_image,
                 "file_path": cleaned_path, # Include path for context
-                "original_size": file_info.size,
-                "compressed_size": len(compressed_bytes)
+                "original_size": size,
+                "compressed_size": compressed_size
             }
 
             # Add the temporary message using the thread_manager callback
@@ -200,7 +225,7 @@ class SandboxVisionTool(SandboxToolsBase):
             )
 
             # Inform the agent the image will be available next turn
-            return self.success_response(f"Successfully loaded and compressed the image '{cleaned_path}' (reduced from {file_info.size / 1024:.1f}KB to {len(compressed_bytes) / 1024:.1f}KB).")
+            return self.success_response(f"Successfully loaded and compressed the image '{cleaned_path}' (reduced from {size / 1024:.1f}KB to {compressed_size / 1024:.1f}KB).")
 
         except Exception as e:
             return self.fail_response(f"An unexpected error occurred while trying to see the image: {str(e)}") 
\ No newline at end of file
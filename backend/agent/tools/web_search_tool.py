@@ -1,24 +1,92 @@
-from tavily import AsyncTavilyClient
 import httpx
-from dotenv import load_dotenv
 from agentpress.tool import Tool, ToolResult, openapi_schema, xml_schema
 from utils.config import config
 from sandbox.tool_base import SandboxToolsBase
 from agentpress.thread_manager import ThreadManager
-import json
 import os
-import datetime
+from urllib.parse import urldefrag, urlparse
 import asyncio
 import logging
+import random
+import string
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import orjson
 
 # TODO: add subpages, etc... in filters as sometimes its necessary 
 
+# Maximum number of scrape result uploads to the sandbox in flight at once
+MAX_CONCURRENT_UPLOADS = 4
+SEARCH1_API_URL = "https://api.search1api.com/search"
+
+# Maximum number of search1api requests in flight at once, to stay clear of rate limits
+MAX_CONCURRENT_SEARCHES = 4
+
+# Largest Firecrawl response body accepted for a single page
+MAX_SCRAPE_RESPONSE_BYTES = 10 * 1024 * 1024
+
+# Successful scrapes are reused for repeat requests of the same URL within this window
+SCRAPE_CACHE_TTL_SECONDS = 600
+SCRAPE_CACHE_SIZE = 256
+# Search results are reused for the same normalized query within this window
+SEARCH_CACHE_TTL_SECONDS = 300
+
+# Status codes worth retrying; anything else is treated as a permanent failure
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+MAX_RETRY_AFTER_SECONDS = 30
+MAX_BACKOFF_SECONDS = 15
+
+T = TypeVar("T")
+
+# Maps every non-alphanumeric ASCII character to "_" for building filenames from domains
+_SAFE_CHARS = frozenset(string.ascii_letters + string.digits)
+_DOMAIN_TRANS = str.maketrans({c: "_" for c in map(chr, range(128)) if c not in _SAFE_CHARS})
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """Return the server-requested delay from a 429/503 Retry-After header, if any."""
+    if not isinstance(error, httpx.HTTPStatusError) or error.response.status_code not in (429, 503):
+        return None
+    try:
+        return min(float(error.response.headers.get("Retry-After", "")), MAX_RETRY_AFTER_SECONDS)
+    except ValueError:
+        return None
+
+
+async def _retry(coro_factory: Callable[[], Awaitable[T]], *, attempts: int = 3, base: float = 1.0) -> T:
+    """Run an HTTP request, retrying transient failures.
+
+    Transport errors (timeouts, dropped connections) and 429/5xx responses are
+    retried with jittered exponential backoff so parallel scrapes don't retry in
+    lockstep. A Retry-After header on 429/503 responses takes precedence. Any
+    other error is raised immediately.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return await coro_factory()
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            if isinstance(e, httpx.HTTPStatusError) and e.response.status_code not in RETRYABLE_STATUS_CODES:
+                raise
+            if attempt >= attempts:
+                raise
+            delay = _retry_after_seconds(e)
+            if delay is None:
+                delay = min(MAX_BACKOFF_SECONDS, base * (2 ** attempt) + random.uniform(0, 1))
+            logging.warning("Request failed (attempt %d/%d): %s. Retrying in %.1fs", attempt, attempts, e, delay)
+            await asyncio.sleep(delay)
+
+
+def _json_dumps(obj) -> str:
+    """Serialize to a compact JSON string, keeping non-ASCII characters as-is."""
+    return orjson.dumps(obj).decode()
+
 class SandboxWebSearchTool(SandboxToolsBase):
     """Tool for performing web searches using Tavily API and web scraping using Firecrawl."""
 
     def __init__(self, project_id: str, thread_manager: ThreadManager):
         super().__init__(project_id, thread_manager)
-        load_dotenv()
         self.search1_api_key = config.SEARCH1_API_KEY # New
         self.firecrawl_api_key = config.FIRECRAWL_API_KEY
         self.firecrawl_url = config.FIRECRAWL_URL
@@ -28,7 +96,38 @@ class SandboxWebSearchTool(SandboxToolsBase):
         if not self.firecrawl_api_key:
             raise ValueError("FIRECRAWL_API_KEY not found in configuration")
 
-        self.http_client = httpx.AsyncClient() # New
+        self._firecrawl_headers = {
+            "Authorization": f"Bearer {self.firecrawl_api_key}",
+            "Content-Type": "application/json",
+        }
+        self._firecrawl_scrape_url = f"{self.firecrawl_url}/v1/scrape"
+        self._search1_headers = {
+            "Authorization": f"Bearer {self.search1_api_key}",
+            "Content-Type": "application/json"
+        }
+
+        # Shared by search and all Firecrawl scrapes so connections are kept alive
+        # and reused instead of paying a TCP + TLS handshake per request. Idle
+        # connections are kept for a minute so they survive the gap between turns.
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=60)
+        )
+        # Maximum number of Firecrawl scrapes in flight at once for this tool instance
+        self.max_concurrency = max(1, config.SCRAPE_CONCURRENCY)
+        self._scrape_semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._upload_semaphore = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+        self._search_semaphore = asyncio.Semaphore(MAX_CONCURRENT_SEARCHES)
+        self._scrape_dir_ready = False
+        # Not read from config; callers that need every scrape fetched fresh set this to False
+        self.cache_enabled = True
+        # url -> (expires_at, result, saved_bytes) for successful scrapes, least recently used first;
+        # saved_bytes is the size of the result file, checked before the entry is reused
+        self._scrape_cache: "OrderedDict[str, tuple[float, dict, int]]" = OrderedDict()
+        # (normalized query, num_results) -> (expires_at, results)
+        self._search_cache: "dict[tuple[str, int], tuple[float, list]]" = {}
+        # (normalized query, num_results) -> in-flight search shared by concurrent identical calls
+        self._search_inflight: "dict[tuple[str, int], asyncio.Future]" = {}
+        self._scrape_dir_lock = asyncio.Lock()
 
     @openapi_schema({
         "type": "function",
@@ -99,56 +198,74 @@ class SandboxWebSearchTool(SandboxToolsBase):
             else:
                 num_results = 10
 
-            logging.info(f"Executing web search with SearchApi.ai for query: '{query}' with {num_results} results")
-            
-            api_url = "https://api.search1api.com/search"
-            headers = {
-                "Authorization": f"Bearer {self.search1_api_key}",
-                "Content-Type": "application/json"
-            }
-            payload = {
-                "query": query,
-                "max_results": num_results,
-                # "search_service": "google", # Optional: defaults to google
-                # "crawl_results": 0,       # Optional: we use Firecrawl separately
-                # "image": False,           # Optional
-            }
+            cache_key = (query.strip().lower(), num_results)
+            cached = self._search_cache.get(cache_key)
+            if cached and cached[0] > time.monotonic():
+                logging.info("Using cached search results for query: '%s'", query)
+                return ToolResult(
+                    success=True,
+                    output=_json_dumps(cached[1])
+                )
 
-            response = await self.http_client.post(api_url, headers=headers, json=payload)
-            response.raise_for_status()  # Raise an exception for bad status codes
-            
-            search_data = response.json()
+            # Identical searches issued concurrently (e.g. parallel tool calls) share one request
+            search = self._search_inflight.get(cache_key)
+            if search is None:
+                search = asyncio.ensure_future(self._search(query, num_results))
+                self._search_inflight[cache_key] = search
+                search.add_done_callback(lambda _: self._search_inflight.pop(cache_key, None))
+            # Shield so one caller being cancelled doesn't cancel the search for the others
+            search_data = await asyncio.shield(search)
             
             results = search_data.get('results', [])
-            logging.info(f"Retrieved {len(results)} search results for query: '{query}' from SearchApi.ai")
+            logging.info("Retrieved %d search results for query: '%s' from SearchApi.ai", len(results), query)
 
             if results:
+                now = time.monotonic()
+                self._search_cache = {k: v for k, v in self._search_cache.items() if v[0] > now}
+                self._search_cache[cache_key] = (now + SEARCH_CACHE_TTL_SECONDS, results)
                 # We return just the 'results' array, similar to how Tavily's results might be used.
                 # The agent can then process this list of {title, link, snippet, content}.
                 return ToolResult(
                     success=True,
-                    output=json.dumps(results, ensure_ascii=False)
+                    output=_json_dumps(results)
                 )
             else:
-                logging.warning(f"No search results found for query: '{query}' from SearchApi.ai")
+                logging.warning("No search results found for query: '%s' from SearchApi.ai", query)
                 # Return the full response from SearchApi.ai if no results, for context
                 return ToolResult(
                     success=False,
-                    output=json.dumps(search_data, ensure_ascii=False)
+                    output=_json_dumps(search_data)
                 )
 
         except httpx.HTTPStatusError as e:
-            error_message = f"SearchApi.ai request failed: {e.response.status_code} - {e.response.text}"
-            logging.error(error_message)
+            logging.error("SearchApi.ai request failed: %s - %s", e.response.status_code, e.response.text)
             return self.fail_response(f"Search API request error: {e.response.status_code}")
         except Exception as e:
             error_message = str(e)
-            logging.error(f"Error performing web search for '{query}' with SearchApi.ai: {error_message}")
+            logging.error("Error performing web search for '%s' with SearchApi.ai: %s", query, error_message)
             simplified_message = f"Error performing web search: {error_message[:200]}"
             if len(error_message) > 200:
                 simplified_message += "..."
             return self.fail_response(simplified_message)
 
+    async def _search(self, query: str, num_results: int) -> dict:
+        """Run a single search1api request and return the parsed response."""
+        logging.info("Executing web search with SearchApi.ai for query: '%s' with %d results", query, num_results)
+        
+        payload = {
+            "query": query,
+            "max_results": num_results,
+            # "search_service": "google", # Optional: defaults to google
+            # "crawl_results": 0,       # Optional: we use Firecrawl separately
+            # "image": False,           # Optional
+        }
+
+        async with self._search_semaphore:
+            response = await self.http_client.post(SEARCH1_API_URL, headers=self._search1_headers, json=payload)
+        response.raise_for_status()  # Raise an exception for bad status codes
+        
+        return response.json()
+
     @openapi_schema({
         "type": "function",
         "function": {
@@ -193,7 +310,7 @@ class SandboxWebSearchTool(SandboxToolsBase):
         - urls: Multiple URLs to scrape, separated by commas
         """
         try:
-            logging.info(f"Starting to scrape webpages: {urls}")
+            logging.info("Starting to scrape webpages: %s", urls)
             
             # Ensure sandbox is initialized
             await self._ensure_sandbox()
@@ -203,8 +320,28 @@ class SandboxWebSearchTool(SandboxToolsBase):
                 logging.warning("Scrape attempt with empty URLs")
                 return self.fail_response("Valid URLs are required.")
             
-            # Split the URLs string into a list
-            url_list = [url.strip() for url in urls.split(',') if url.strip()]
+            # Split, add a protocol where missing and drop duplicates and invalid URLs in a single pass
+            url_list = []
+            seen = set()
+            for raw_url in urls.split(','):
+                url = raw_url.strip()
+                if not url:
+                    continue
+                if not url.startswith(('http://', 'https://')):
+                    if '://' in url:
+                        # Don't spend a Firecrawl call on e.g. ftp:// or file:// URLs
+                        logging.warning("Skipping URL with unsupported scheme: %s", url)
+                        continue
+                    url = 'https://' + url
+                # Fragments don't change the fetched page, so drop them before deduplicating
+                url = urldefrag(url).url
+                if url in seen:
+                    continue
+                if not urlparse(url).netloc:
+                    logging.warning("Skipping URL without a host: %s", url)
+                    continue
+                seen.add(url)
+                url_list.append(url)
             
             if not url_list:
                 logging.warning("No valid URLs found in the input")
@@ -213,28 +350,28 @@ class SandboxWebSearchTool(SandboxToolsBase):
             if len(url_list) == 1:
                 logging.warning("Only a single URL provided - for efficiency you should scrape multiple URLs at once")
             
-            logging.info(f"Processing {len(url_list)} URLs: {url_list}")
+            logging.info("Processing %d URLs: %s", len(url_list), url_list)
+            
+            # One timestamp for the whole batch so its result files sort and group together
+            timestamp = time.strftime("%Y%m%d_%H%M%S")
+            
+            # Scrape all URLs concurrently; latency is bounded by the slowest URL
+            scrape_results = await asyncio.gather(
+                *(self._scrape_single_url(url, timestamp, index) for index, url in enumerate(url_list)),
+                return_exceptions=True
+            )
             
-            # Process each URL and collect results
             results = []
-            for url in url_list:
-                try:
-                    # Add protocol if missing
-                    if not (url.startswith('http://') or url.startswith('https://')):
-                        url = 'https://' + url
-                        logging.info(f"Added https:// protocol to URL: {url}")
-                    
-                    # Scrape this URL
-                    result = await self._scrape_single_url(url)
-                    results.append(result)
-                    
-                except Exception as e:
-                    logging.error(f"Error processing URL {url}: {str(e)}")
+            for url, result in zip(url_list, scrape_results):
+                if isinstance(result, Exception):
+                    logging.error("Error processing URL %s: %s", url, result)
                     results.append({
                         "url": url,
                         "success": False,
-                        "error": str(e)
+                        "error": str(result)
                     })
+                else:
+                    results.append(result)
             
             # Summarize results
             successful = sum(1 for r in results if r.get("success", False))
@@ -242,19 +379,15 @@ class SandboxWebSearchTool(SandboxToolsBase):
             
             # Create success/failure message
             if successful == len(results):
-                message = f"Successfully scraped all {len(results)} URLs. Results saved to:"
-                for r in results:
-                    if r.get("file_path"):
-                        message += f"\n- {r.get('file_path')}"
+                parts = [f"Successfully scraped all {len(results)} URLs. Results saved to:"]
+                parts.extend(f"- {r.get('file_path')}" for r in results if r.get("file_path"))
+                message = "\n".join(parts)
             elif successful > 0:
-                message = f"Scraped {successful} URLs successfully and {failed} failed. Results saved to:"
-                for r in results:
-                    if r.get("success", False) and r.get("file_path"):
-                        message += f"\n- {r.get('file_path')}"
-                message += "\n\nFailed URLs:"
-                for r in results:
-                    if not r.get("success", False):
-                        message += f"\n- {r.get('url')}: {r.get('error', 'Unknown error')}"
+                parts = [f"Scraped {successful} URLs successfully and {failed} failed. Results saved to:"]
+                parts.extend(f"- {r.get('file_path')}" for r in results if r.get("success", False) and r.get("file_path"))
+                parts.append("\nFailed URLs:")
+                parts.extend(f"- {r.get('url')}: {r.get('error', 'Unknown error')}" for r in results if not r.get("success", False))
+                message = "\n".join(parts)
             else:
                 error_details = "; ".join([f"{r.get('url')}: {r.get('error', 'Unknown error')}" for r in results])
                 return self.fail_response(f"Failed to scrape all {len(results)} URLs. Errors: {error_details}")
@@ -266,63 +399,85 @@ class SandboxWebSearchTool(SandboxToolsBase):
         
         except Exception as e:
             error_message = str(e)
-            logging.error(f"Error in scrape_webpage: {error_message}")
+            logging.error("Error in scrape_webpage: %s", error_message)
             return self.fail_response(f"Error processing scrape request: {error_message[:200]}")
     
-    async def _scrape_single_url(self, url: str) -> dict:
+    async def _scrape_single_url(self, url: str, timestamp: str, index: int) -> dict:
         """
         Helper function to scrape a single URL and return the result information.
+
+        timestamp is shared by every URL in the batch; index keeps filenames unique
+        when several URLs in the batch share a domain.
         """
-        logging.info(f"Scraping single URL: {url}")
+        logging.info("Scraping single URL: %s", url)
+        
+        if self.cache_enabled:
+            cached = self._scrape_cache.get(url)
+            if cached:
+                expires_at, cached_result, saved_bytes = cached
+                # The agent may have deleted or rewritten the saved file since, so
+                # only reuse the entry while the file is still there as written
+                if expires_at > time.monotonic() and await self._result_file_intact(cached_result["file_path"], saved_bytes):
+                    self._scrape_cache.move_to_end(url)
+                    logging.info("Using cached scrape of %s saved to %s", url, cached_result["file_path"])
+                    return dict(cached_result)
+                self._scrape_cache.pop(url, None)
         
         try:
             # ---------- Firecrawl scrape endpoint ----------
-            logging.info(f"Sending request to Firecrawl for URL: {url}")
-            async with httpx.AsyncClient() as client:
-                headers = {
-                    "Authorization": f"Bearer {self.firecrawl_api_key}",
-                    "Content-Type": "application/json",
-                }
-                payload = {
-                    "url": url,
-                    "formats": ["markdown"]
-                }
-                
-                # Use longer timeout and retry logic for more reliability
-                max_retries = 3
-                timeout_seconds = 120
-                retry_count = 0
-                
-                while retry_count < max_retries:
-                    try:
-                        logging.info(f"Sending request to Firecrawl (attempt {retry_count + 1}/{max_retries})")
-                        response = await client.post(
-                            f"{self.firecrawl_url}/v1/scrape",
-                            json=payload,
-                            headers=headers,
-                            timeout=timeout_seconds,
-                        )
+            logging.info("Sending request to Firecrawl for URL: %s", url)
+            payload = {
+                "url": url,
+                "formats": ["markdown"]
+            }
+            
+            # Use longer timeout and retry logic for more reliability
+            timeout_seconds = 120
+            
+            async def send_request() -> dict:
+                logging.info("Sending request to Firecrawl for %s", url)
+                # Stream the body so one oversized page can't exhaust memory
+                async with self.http_client.stream(
+                    "POST",
+                    self._firecrawl_scrape_url,
+                    json=payload,
+                    headers=self._firecrawl_headers,
+                    timeout=timeout_seconds,
+                ) as response:
+                    if response.status_code >= 300:
+                        # Only build the HTTPStatusError off the 2xx fast path
+                        await response.aread()
                         response.raise_for_status()
-                        data = response.json()
-                        logging.info(f"Successfully received response from Firecrawl for {url}")
-                        break
-                    except (httpx.ReadTimeout, httpx.ConnectTimeout, httpx.ReadError) as timeout_err:
-                        retry_count += 1
-                        logging.warning(f"Request timed out (attempt {retry_count}/{max_retries}): {str(timeout_err)}")
-                        if retry_count >= max_retries:
-                            raise Exception(f"Request timed out after {max_retries} attempts with {timeout_seconds}s timeout")
-                        # Exponential backoff
-                        logging.info(f"Waiting {2 ** retry_count}s before retry")
-                        await asyncio.sleep(2 ** retry_count)
-                    except Exception as e:
-                        # Don't retry on non-timeout errors
-                        logging.error(f"Error during scraping: {str(e)}")
-                        raise e
-
-            # Format the response
-            title = data.get("data", {}).get("metadata", {}).get("title", "")
-            markdown_content = data.get("data", {}).get("markdown", "")
-            logging.info(f"Extracted content from {url}: title='{title}', content length={len(markdown_content)}")
+                    # A non-JSON 2xx body (e.g. an HTML page from a proxy in front of a
+                    # self-hosted Firecrawl) can't be parsed, so don't download it
+                    content_type = response.headers.get("Content-Type", "").split(";", 1)[0].strip().lower()
+                    if content_type and content_type != "application/json":
+                        raise ValueError(f"Unexpected Content-Type from Firecrawl: {content_type}")
+                    content_length = response.headers.get("Content-Length")
+                    if content_length and content_length.isdigit() and int(content_length) > MAX_SCRAPE_RESPONSE_BYTES:
+                        raise ValueError(f"Response too large ({int(content_length)} bytes)")
+                    body = bytearray()
+                    async for chunk in response.aiter_bytes():
+                        body.extend(chunk)
+                        if len(body) > MAX_SCRAPE_RESPONSE_BYTES:
+                            raise ValueError(f"Response exceeded {MAX_SCRAPE_RESPONSE_BYTES} bytes")
+                # Parse the raw body directly, skipping the intermediate text decode
+                return orjson.loads(body)
+            
+            # Only the Firecrawl request holds a scrape slot, so the next URL's
+            # fetch starts while this one is serialized and uploaded
+            async with self._scrape_semaphore:
+                data = await _retry(send_request, attempts=3)
+            logging.info("Successfully received response from Firecrawl for %s", url)
+
+            # Format the response; only the page payload is kept, the rest of the
+            # parsed response is released before the result is serialized and uploaded
+            page = data.get("data", {})
+            del data
+            metadata = page.get("metadata")
+            title = (metadata or {}).get("title", "")
+            markdown_content = page.get("markdown", "")
+            logging.info("Extracted content from %s: title='%s', content length=%d", url, title, len(markdown_content))
             
             formatted_result = {
                 "title": title,
@@ -331,48 +486,45 @@ class SandboxWebSearchTool(SandboxToolsBase):
             }
             
             # Add metadata if available
-            if "metadata" in data.get("data", {}):
-                formatted_result["metadata"] = data["data"]["metadata"]
-                logging.info(f"Added metadata: {data['data']['metadata'].keys()}")
-            
-            # Create a simple filename from the URL domain and date
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            if metadata is not None:
+                formatted_result["metadata"] = metadata
+                if logging.getLogger().isEnabledFor(logging.INFO):
+                    logging.info("Added metadata: %s", list(metadata.keys()))
+            del page
             
-            # Extract domain from URL for the filename
-            from urllib.parse import urlparse
-            parsed_url = urlparse(url)
-            domain = parsed_url.netloc.replace("www.", "")
+            # Create a simple filename from the batch timestamp, URL index and domain
+            # (without a leading "www.")
+            domain = urlparse(url).netloc.removeprefix("www.").translate(_DOMAIN_TRANS)
+            safe_filename = f"{timestamp}_{index:02d}_{domain}.json"
             
-            # Clean up domain for filename
-            domain = "".join([c if c.isalnum() else "_" for c in domain])
-            safe_filename = f"{timestamp}_{domain}.json"
-            
-            logging.info(f"Generated filename: {safe_filename}")
+            logging.info("Generated filename: %s", safe_filename)
             
             # Save results to a file in the /workspace/scrape directory
-            scrape_dir = f"{self.workspace_path}/scrape"
-            self.sandbox.fs.create_folder(scrape_dir, "755")
+            scrape_dir = await self._ensure_scrape_dir()
             
             results_file_path = f"{scrape_dir}/{safe_filename}"
-            json_content = json.dumps(formatted_result, ensure_ascii=False, indent=2)
-            logging.info(f"Saving content to file: {results_file_path}, size: {len(json_content)} bytes")
-            
-            self.sandbox.fs.upload_file(
-                json_content.encode(),
-                results_file_path,
-            )
+            # Serialize and upload in a worker thread so other scrapes keep running
+            async with self._upload_semaphore:
+                saved_bytes = await asyncio.to_thread(self._write_result_file, results_file_path, formatted_result)
+            logging.info("Saved content to file: %s, size: %d bytes", results_file_path, saved_bytes)
             
-            return {
+            result = {
                 "url": url,
                 "success": True,
                 "title": title,
                 "file_path": results_file_path,
                 "content_length": len(markdown_content)
             }
+            if self.cache_enabled:
+                self._scrape_cache[url] = (time.monotonic() + SCRAPE_CACHE_TTL_SECONDS, result, saved_bytes)
+                self._scrape_cache.move_to_end(url)
+                if len(self._scrape_cache) > SCRAPE_CACHE_SIZE:
+                    self._scrape_cache.popitem(last=False)
+            return dict(result)
         
         except Exception as e:
             error_message = str(e)
-            logging.error(f"Error scraping URL '{url}': {error_message}")
+            logging.error("Error scraping URL '%s': %s", url, error_message)
             
             # Create an error result
             return {
@@ -381,6 +533,37 @@ class SandboxWebSearchTool(SandboxToolsBase):
                 "error": error_message
             }
 
+    async def _ensure_scrape_dir(self) -> str:
+        """Create the scrape output directory once per tool instance and return its path."""
+        scrape_dir = f"{self.workspace_path}/scrape"
+        if not self._scrape_dir_ready:
+            async with self._scrape_dir_lock:
+                if not self._scrape_dir_ready:
+                    await asyncio.to_thread(self.sandbox.fs.create_folder, scrape_dir, "755")
+                    self._scrape_dir_ready = True
+        return scrape_dir
+
+    async def _result_file_intact(self, file_path: str, expected_size: int) -> bool:
+        """Check that a previously saved result file still exists with its original size."""
+        try:
+            file_info = await asyncio.to_thread(self.sandbox.fs.get_file_info, file_path)
+        except Exception:
+            return False
+        return not file_info.is_dir and file_info.size == expected_size
+
+    def _write_result_file(self, file_path: str, result: dict) -> int:
+        """Serialize a scrape result and upload it to the sandbox.
+
+        Blocking; called via asyncio.to_thread. Returns the number of bytes written.
+        """
+        json_content = orjson.dumps(result, option=orjson.OPT_INDENT_2)
+        self.sandbox.fs.upload_file(json_content, file_path)
+        return len(json_content)
+
+    async def aclose(self) -> None:
+        """Close the shared HTTP client."""
+        await self.http_client.aclose()
+
 if __name__ == "__main__":
     async def test_web_search():
         """Test function for the web search tool"""
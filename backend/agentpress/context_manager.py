@@ -5,8 +5,14 @@ This module handles token counting and thread summarization to prevent
 reaching the context window limitations of LLM models.
 """
 
+import asyncio
+import hashlib
 import json
-from typing import List, Dict, Any, Optional
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+import orjson
 
 from litellm import token_counter, completion_cost
 from services.database import DBConnection # Updated import
@@ -17,6 +23,138 @@ from utils.logger import logger
 DEFAULT_TOKEN_THRESHOLD = 120000  # 80k tokens threshold for summarization
 SUMMARY_TARGET_TOKENS = 10000    # Target ~10k tokens for the summary message
 RESERVE_TOKENS = 5000            # Reserve tokens for new messages
+SUMMARY_PROMPT_OVERHEAD_TOKENS = 2000  # Summarization instructions and delimiters
+CHARS_PER_TOKEN = 4               # Rough ratio for English text and JSON
+FAST_ESTIMATE_MARGIN = 0.2        # Count exactly only within ±20% of the threshold
+LAST_SUMMARY_CACHE_SIZE = 10000   # Threads whose latest summary timestamp is cached
+MESSAGE_PAGE_SIZE = 1000          # Rows fetched per page of thread history
+IMAGE_TOKEN_ESTIMATE = 1000       # Rough cost of one image part; its base64 size says little about it
+
+# Message types that map directly to an LLM role
+LLM_ROLES = frozenset({'assistant', 'user', 'system', 'tool'})
+
+# Per-message token counts keyed by (model, content digest), shared by all threads
+MESSAGE_TOKEN_CACHE_SIZE = 50000
+_message_token_cache: "OrderedDict[Tuple[str, bytes], int]" = OrderedDict()
+# Counting runs in worker threads, so cache updates are serialized
+_message_token_cache_lock = threading.Lock()
+
+# Tokens token_counter adds once per request (e.g. reply priming for OpenAI
+# tokenizers, none for most Hugging Face ones), measured per model with a probe
+_OVERHEAD_PROBE_MESSAGE = {"role": "user", "content": "ping"}
+_request_overhead_tokens: Dict[str, int] = {}
+
+# Static parts of the summarization system prompt; only the history between them varies
+SUMMARY_SYSTEM_PREFIX = """You are a specialized summarization assistant. Your task is to create a concise but comprehensive summary of the conversation history.
+
+The summary should:
+1. Preserve all key information including decisions, conclusions, and important context
+2. Include any tools that were used and their results
+3. Maintain chronological order of events
+4. Be presented as a narrated list of key points with section headers
+5. Include only factual information from the conversation (no new information)
+6. Be concise but detailed enough that the conversation can continue with this summary as context
+
+VERY IMPORTANT: This summary will replace older parts of the conversation in the LLM's context window, so ensure it contains ALL key information and LATEST STATE OF THE CONVERSATION - SO WE WILL KNOW HOW TO PICK UP WHERE WE LEFT OFF.
+
+
+THE CONVERSATION HISTORY TO SUMMARIZE IS AS FOLLOWS:
+===============================================================
+==================== CONVERSATION HISTORY ====================
+"""
+SUMMARY_SYSTEM_SUFFIX = """
+==================== END OF CONVERSATION HISTORY ====================
+===============================================================
+"""
+
+
+def _get_request_overhead_tokens(model: str) -> int:
+    """Measure how many tokens token_counter adds once per request for a model."""
+    overhead = _request_overhead_tokens.get(model)
+    if overhead is None:
+        single = token_counter(model=model, messages=[_OVERHEAD_PROBE_MESSAGE])
+        double = token_counter(model=model, messages=[_OVERHEAD_PROBE_MESSAGE, _OVERHEAD_PROBE_MESSAGE])
+        overhead = max(0, 2 * single - double)
+        _request_overhead_tokens[model] = overhead
+    return overhead
+
+
+def count_message_tokens(model: str, messages: List[Dict[str, Any]]) -> int:
+    """Count tokens for a list of messages, only tokenizing messages not seen before.
+    
+    Thread history only grows at the tail, so repeated counts of the same thread
+    reuse the cached counts of every earlier message.
+    
+    The result is the sum of per-message counts plus the model's per-request
+    overhead, so it approximates token_counter(model=model, messages=messages)
+    rather than matching it exactly: litellm counts messages with tool_calls as
+    concatenated text without per-message overhead, and tokenizers that work on
+    the concatenated text can merge tokens across message boundaries.
+    
+    Args:
+        model: Model whose tokenizer litellm should use
+        messages: Messages to count
+        
+    Returns:
+        Approximate total token count
+    """
+    overhead = _get_request_overhead_tokens(model)
+    total = overhead
+    for message in messages:
+        serialized = orjson.dumps(message, option=orjson.OPT_SORT_KEYS, default=str)
+        key = (model, hashlib.blake2b(serialized, digest_size=16).digest())
+        with _message_token_cache_lock:
+            count = _message_token_cache.get(key)
+            if count is not None:
+                _message_token_cache.move_to_end(key)
+        if count is None:
+            count = max(0, token_counter(model=model, messages=[message]) - overhead)
+            with _message_token_cache_lock:
+                _message_token_cache[key] = count
+                if len(_message_token_cache) > MESSAGE_TOKEN_CACHE_SIZE:
+                    _message_token_cache.popitem(last=False)
+        total += count
+    return total
+
+
+def _estimate_content_chars(content: Any) -> int:
+    """Approximate the text length of message content, charging image parts a flat cost."""
+    if isinstance(content, str):
+        if content.startswith('data:') and ';base64,' in content[:100]:
+            return IMAGE_TOKEN_ESTIMATE * CHARS_PER_TOKEN
+        return len(content)
+    if isinstance(content, dict):
+        if content.get('type') in ('image_url', 'image'):
+            return IMAGE_TOKEN_ESTIMATE * CHARS_PER_TOKEN
+        return sum(len(str(key)) + _estimate_content_chars(value) for key, value in content.items())
+    if isinstance(content, (list, tuple)):
+        return sum(_estimate_content_chars(item) for item in content)
+    return len(str(content))
+
+
+def _fast_token_estimate(messages: List[Dict[str, Any]]) -> int:
+    """Estimate the token count of messages from their content and tool call lengths."""
+    chars = 0
+    for message in messages:
+        content = message.get('content', '') if isinstance(message, dict) else message
+        chars += _estimate_content_chars(content)
+        # Native tool calls carry their arguments outside content, often with little or no text
+        tool_calls = message.get('tool_calls') if isinstance(message, dict) else None
+        if tool_calls:
+            chars += len(json.dumps(tool_calls, default=str))
+    return chars // CHARS_PER_TOKEN
+
+
+def _count_recent_within_budget(messages: List[Dict[str, Any]], budget: int) -> int:
+    """Return how many of the newest messages fit in the token budget (always at least one)."""
+    used = 0
+    kept = 0
+    for message in reversed(messages):
+        used += count_message_tokens("gpt-4", [message]) - _get_request_overhead_tokens("gpt-4")
+        if used > budget and kept > 0:
+            break
+        kept += 1
+    return kept
 
 class ContextManager:
     """Manages thread context including token counting and summarization."""
@@ -29,6 +167,15 @@ class ContextManager:
         """
         self.db = DBConnection()
         self.token_threshold = token_threshold
+        # thread_id -> created_at of its latest summary (None if it has none)
+        self._last_summary_times: "OrderedDict[str, Optional[str]]" = OrderedDict()
+    
+    def _remember_summary_time(self, thread_id: str, created_at: Optional[str]) -> None:
+        """Cache the latest summary timestamp for a thread, evicting the oldest entries."""
+        self._last_summary_times[thread_id] = created_at
+        self._last_summary_times.move_to_end(thread_id)
+        if len(self._last_summary_times) > LAST_SUMMARY_CACHE_SIZE:
+            self._last_summary_times.popitem(last=False)
     
     async def get_thread_token_count(self, thread_id: str) -> int:
         """Get the current token count for a thread using LiteLLM.
@@ -42,24 +189,50 @@ class ContextManager:
         logger.debug(f"Getting token count for thread {thread_id}")
         
         try:
-            # Get messages for the thread
-            messages = await self.get_messages_for_summarization(thread_id)
-            
-            if not messages:
-                logger.debug(f"No messages found for thread {thread_id}")
-                return 0
-            
-            # Use litellm's token_counter for accurate model-specific counting
-            # This is much more accurate than the SQL-based estimation
-            token_count = token_counter(model="gpt-4", messages=messages)
-            
-            logger.info(f"Thread {thread_id} has {token_count} tokens (calculated with litellm)")
+            _, token_count, _ = await self._load_and_count(thread_id)
             return token_count
                 
         except Exception as e:
             logger.error(f"Error getting token count: {str(e)}")
             return 0
     
+    async def _load_and_count(
+        self, 
+        thread_id: str, 
+        threshold: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], int, bool]:
+        """Fetch the messages since the last summary and count their tokens in one pass.
+        
+        Args:
+            thread_id: ID of the thread to analyze
+            threshold: If given, only an approximate count is returned when the
+                character-based estimate is clearly below or above this threshold
+            
+        Returns:
+            Tuple of (messages, token_count, is_estimate)
+        """
+        # Get messages for the thread
+        messages = await self.get_messages_for_summarization(thread_id)
+        
+        if not messages:
+            logger.debug(f"No messages found for thread {thread_id}")
+            return messages, 0, False
+        
+        if threshold is not None:
+            # Deciding which side of the threshold we're on rarely needs exact counts
+            estimate = _fast_token_estimate(messages)
+            if not (1 - FAST_ESTIMATE_MARGIN) * threshold <= estimate <= (1 + FAST_ESTIMATE_MARGIN) * threshold:
+                logger.debug(f"Thread {thread_id} has ~{estimate} tokens (estimated from length)")
+                return messages, estimate, True
+        
+        # Use litellm's token_counter for accurate model-specific counting,
+        # cached per message so unchanged history isn't re-tokenized
+        # Tokenizing is CPU-bound, so keep it off the event loop
+        token_count = await asyncio.to_thread(count_message_tokens, "gpt-4", messages)
+        
+        logger.info(f"Thread {thread_id} has {token_count} tokens (calculated with litellm)")
+        return messages, token_count, False
+    
     async def get_messages_for_summarization(self, thread_id: str) -> List[Dict[str, Any]]:
         """Get all LLM messages from the thread that need to be summarized.
         
@@ -74,63 +247,79 @@ class ContextManager:
             List of message objects to summarize
         """
         logger.debug(f"Getting messages for summarization for thread {thread_id}")
-        client = await self.db.client
         
         try:
-            # Find the most recent summary message
-            summary_result = await client.table('messages').select('created_at') \
-                .eq('thread_id', thread_id) \
-                .eq('type', 'summary') \
-                .eq('is_llm_message', True) \
-                .order('created_at', desc=True) \
-                .limit(1) \
-                .execute()
+            if thread_id in self._last_summary_times:
+                self._last_summary_times.move_to_end(thread_id)
+                last_summary_time = self._last_summary_times[thread_id]
+            else:
+                # Look up the most recent summary once; the pages below only read what follows it
+                last_summary_at = await self.db.execute_val(
+                    """
+                    SELECT max(created_at) FROM messages
+                    WHERE thread_id = $1 AND is_llm_message = TRUE AND type = 'summary'
+                    """,
+                    thread_id,
+                )
+                last_summary_time = str(last_summary_at) if last_summary_at else None
+                self._remember_summary_time(thread_id, last_summary_time)
             
-            # Get messages after the most recent summary or all messages if no summary
-            if summary_result.data and len(summary_result.data) > 0:
-                last_summary_time = summary_result.data[0]['created_at']
+            if last_summary_time:
                 logger.debug(f"Found last summary at {last_summary_time}")
-                
-                # Get all messages after the summary, but NOT including the summary itself
-                messages_result = await client.table('messages').select('*') \
-                    .eq('thread_id', thread_id) \
-                    .eq('is_llm_message', True) \
-                    .gt('created_at', last_summary_time) \
-                    .order('created_at') \
-                    .execute()
             else:
                 logger.debug("No previous summary found, getting all messages")
-                # Get all messages
-                messages_result = await client.table('messages').select('*') \
-                    .eq('thread_id', thread_id) \
-                    .eq('is_llm_message', True) \
-                    .order('created_at') \
-                    .execute()
             
-            # Parse the message content if needed
+            # Fetch in pages and parse each page as it arrives, so only one page of
+            # raw rows is held at a time however long the thread is. Pages continue
+            # after the last (created_at, message_id) seen rather than using OFFSET,
+            # so rows sharing a created_at are never skipped or repeated.
             messages = []
-            for msg in messages_result.data:
-                # Skip existing summary messages - we don't want to summarize summaries
-                if msg.get('type') == 'summary':
-                    logger.debug(f"Skipping summary message from {msg.get('created_at')}")
-                    continue
-                    
-                # Parse content if it's a string
-                content = msg['content']
-                if isinstance(content, str):
-                    try:
-                        content = json.loads(content)
-                    except json.JSONDecodeError:
-                        pass  # Keep as string if not valid JSON
+            cursor: Optional[Tuple[Any, Any]] = None
+            while True:
+                conditions = ["thread_id = $1", "is_llm_message = TRUE", "type <> 'summary'"]
+                args: List[Any] = [thread_id]
+                if last_summary_time:
+                    # Get all messages after the summary, but NOT including the summary itself
+                    args.append(last_summary_time)
+                    conditions.append(f"created_at > ${len(args)}::text::timestamptz")
+                if cursor:
+                    args.extend(cursor)
+                    conditions.append(f"(created_at, message_id) > (${len(args) - 1}, ${len(args)})")
+                args.append(MESSAGE_PAGE_SIZE)
+                rows = await self.db.execute(
+                    f"""
+                    SELECT message_id, type, content, created_at FROM messages
+                    WHERE {' AND '.join(conditions)}
+                    ORDER BY created_at, message_id LIMIT ${len(args)}
+                    """,
+                    *args,
+                )
                 
-                # Ensure we have the proper format for the LLM
-                if 'role' not in content and 'type' in msg:
-                    # Convert message type to role if needed
-                    role = msg['type']
-                    if role == 'assistant' or role == 'user' or role == 'system' or role == 'tool':
-                        content = {'role': role, 'content': content}
+                # Summary messages are excluded by the query - we don't want to summarize summaries
+                for msg in rows:
+                    # The pool's jsonb codec has already decoded the column; content stored
+                    # as a JSON-encoded string (json.dumps(...) callers) comes back as a str
+                    # holding JSON and is parsed once more. Plain text is kept as-is without
+                    # paying for a failed parse
+                    content = msg['content']
+                    if isinstance(content, str) and content.startswith(('{', '[')):
+                        try:
+                            content = orjson.loads(content)
+                        except orjson.JSONDecodeError:
+                            pass  # Keep as string if not valid JSON
+                    
+                    # Ensure we have the proper format for the LLM; current rows already
+                    # store {role, content}, only legacy rows need wrapping
+                    if not (isinstance(content, dict) and 'role' in content) and msg['type'] in LLM_ROLES:
+                        # Convert message type to role
+                        content = {'role': msg['type'], 'content': content}
+                    
+                    messages.append(content)
                 
-                messages.append(content)
+                # If we got fewer than a full page, we've reached the end
+                if len(rows) < MESSAGE_PAGE_SIZE:
+                    break
+                cursor = (rows[-1]['created_at'], rows[-1]['message_id'])
             
             logger.info(f"Got {len(messages)} messages to summarize for thread {thread_id}")
             return messages
@@ -143,7 +332,8 @@ class ContextManager:
         self, 
         thread_id: str, 
         messages: List[Dict[str, Any]], 
-        model: str = "gpt-4o-mini"
+        model: str = "gpt-4o-mini",
+        max_prompt_tokens: Optional[int] = None
     ) -> Optional[Dict[str, Any]]:
         """Generate a summary of conversation messages.
         
@@ -151,6 +341,8 @@ class ContextManager:
             thread_id: ID of the thread to summarize
             messages: Messages to summarize
             model: LLM model to use for summarization
+            max_prompt_tokens: Token budget for the summarization prompt; the oldest
+                messages are dropped to fit. Defaults to token_threshold - RESERVE_TOKENS
             
         Returns:
             Summary message object or None if summarization failed
@@ -161,29 +353,24 @@ class ContextManager:
         
         logger.info(f"Creating summary for thread {thread_id} with {len(messages)} messages")
         
+        # Keep the newest messages that fit the budget so runaway threads can't
+        # produce an unbounded summarization prompt
+        if max_prompt_tokens is None:
+            max_prompt_tokens = self.token_threshold - RESERVE_TOKENS
+        budget = max_prompt_tokens - SUMMARY_PROMPT_OVERHEAD_TOKENS
+        kept = await asyncio.to_thread(_count_recent_within_budget, messages, budget)
+        if kept < len(messages):
+            dropped = len(messages) - kept
+            logger.info(f"Omitting {dropped} oldest messages from the summary prompt for thread {thread_id}")
+            messages = [{"role": "system", "content": f"[{dropped} earlier messages omitted]"}] + messages[-kept:]
+        
+        # Serialize the history as JSON rather than interpolating the list's Python repr
+        history_str = orjson.dumps(messages, default=str).decode()
+        
         # Create system message with summarization instructions
         system_message = {
             "role": "system",
-            "content": f"""You are a specialized summarization assistant. Your task is to create a concise but comprehensive summary of the conversation history.
-
-The summary should:
-1. Preserve all key information including decisions, conclusions, and important context
-2. Include any tools that were used and their results
-3. Maintain chronological order of events
-4. Be presented as a narrated list of key points with section headers
-5. Include only factual information from the conversation (no new information)
-6. Be concise but detailed enough that the conversation can continue with this summary as context
-
-VERY IMPORTANT: This summary will replace older parts of the conversation in the LLM's context window, so ensure it contains ALL key information and LATEST STATE OF THE CONVERSATION - SO WE WILL KNOW HOW TO PICK UP WHERE WE LEFT OFF.
-
-
-THE CONVERSATION HISTORY TO SUMMARIZE IS AS FOLLOWS:
-===============================================================
-==================== CONVERSATION HISTORY ====================
-{messages}
-==================== END OF CONVERSATION HISTORY ====================
-===============================================================
-"""
+            "content": "".join((SUMMARY_SYSTEM_PREFIX, history_str, SUMMARY_SYSTEM_SUFFIX))
         }
         
         try:
@@ -201,7 +388,13 @@ THE CONVERSATION HISTORY TO SUMMARIZE IS AS FOLLOWS:
                 
                 # Track token usage
                 try:
-                    token_count = token_counter(model=model, messages=[{"role": "user", "content": summary_content}])
+                    # The provider already reports the completion size; only tokenize if it doesn't
+                    usage = getattr(response, 'usage', None)
+                    token_count = getattr(usage, 'completion_tokens', None)
+                    if token_count is None:
+                        token_count = await asyncio.to_thread(
+                            token_counter, model=model, messages=[{"role": "user", "content": summary_content}]
+                        )
                     cost = completion_cost(model=model, prompt="", completion=summary_content)
                     logger.info(f"Summary generated with {token_count} tokens at cost ${cost:.6f}")
                 except Exception as e:
@@ -252,8 +445,11 @@ The above is a summary of the conversation history. The conversation continues b
             True if summarization was performed, False otherwise
         """
         try:
-            # Get token count using LiteLLM (accurate model-specific counting)
-            token_count = await self.get_thread_token_count(thread_id)
+            # Fetch the messages once and count them with LiteLLM (accurate model-specific
+            # counting); the same messages are summarized below if needed
+            messages, token_count, is_estimate = await self._load_and_count(
+                thread_id, threshold=None if force else self.token_threshold
+            )
             
             # If token count is below threshold and not forcing, no summarization needed
             if token_count < self.token_threshold and not force:
@@ -266,9 +462,6 @@ The above is a summary of the conversation history. The conversation continues b
             else:
                 logger.info(f"Thread {thread_id} exceeds token threshold ({token_count} >= {self.token_threshold}), summarizing...")
             
-            # Get messages to summarize
-            messages = await self.get_messages_for_summarization(thread_id)
-            
             # If there are too few messages, don't summarize
             if len(messages) < 3:
                 logger.info(f"Thread {thread_id} has too few messages ({len(messages)}) to summarize")
@@ -279,14 +472,21 @@ The above is a summary of the conversation history. The conversation continues b
             
             if summary:
                 # Add summary message to thread
-                await add_message_callback(
+                saved = await add_message_callback(
                     thread_id=thread_id,
                     type="summary",
                     content=summary,
                     is_llm_message=True,
-                    metadata={"token_count": token_count}
+                    # A length-based estimate is stored under its own key, never as an exact count
+                    metadata={"token_estimate" if is_estimate else "token_count": token_count}
                 )
                 
+                # Later fetches start after this summary; re-query if its timestamp is unknown
+                if isinstance(saved, dict) and saved.get('created_at'):
+                    self._remember_summary_time(thread_id, str(saved['created_at']))
+                else:
+                    self._last_summary_times.pop(thread_id, None)
+                
                 logger.info(f"Successfully added summary to thread {thread_id}")
                 return True
             else:
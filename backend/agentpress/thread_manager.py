@@ -10,17 +10,23 @@ This module provides comprehensive conversation management, including:
 - Context summarization to manage token limits
 """
 
+import asyncio
+import hashlib
 import json
-from typing import List, Dict, Any, Optional, Type, Union, AsyncGenerator, Literal
+import uuid
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Type, Union, AsyncGenerator, Literal, Tuple
+import orjson
 from services.llm import make_llm_api_call
 from agentpress.tool import Tool
 from agentpress.tool_registry import ToolRegistry
-from agentpress.context_manager import ContextManager
+from agentpress.context_manager import ContextManager, count_message_tokens
 from agentpress.response_processor import (
     ResponseProcessor,
     ProcessorConfig
 )
 from services.supabase import DBConnection
+from services.database import DBConnection as PostgresConnection
 from utils.logger import logger
 from langfuse.client import StatefulGenerationClient, StatefulTraceClient
 from services.langfuse import langfuse
@@ -30,6 +36,39 @@ from litellm import token_counter
 # Type alias for tool choice
 ToolChoice = Literal["auto", "required", "none"]
 
+# Maximum number of queued message rows written in a single INSERT
+MAX_MESSAGE_INSERT_BATCH = 50
+
+# Inserts a JSON array of message rows in array order. created_at comes from the
+# database clock, read once per statement and offset by a microsecond per row, so
+# rows of one batch stay strictly ordered. ON CONFLICT makes retrying rows that
+# were already written (e.g. after a client-side timeout) a no-op.
+INSERT_MESSAGES_SQL = """
+    INSERT INTO messages (message_id, thread_id, type, content, is_llm_message, metadata, created_at)
+    SELECT (m->>'message_id')::uuid, (m->>'thread_id')::uuid, m->>'type', m->'content',
+           (m->>'is_llm_message')::boolean, COALESCE(m->'metadata', '{}'::jsonb),
+           (SELECT TIMEZONE('utc'::text, clock_timestamp())) + (batch.ord - 1) * INTERVAL '1 microsecond'
+    FROM jsonb_array_elements($1::jsonb) WITH ORDINALITY AS batch(m, ord)
+    ORDER BY batch.ord
+    ON CONFLICT (message_id) DO NOTHING
+    RETURNING *
+"""
+
+# Number of system prompts with XML examples appended kept per ThreadManager
+SYSTEM_PROMPT_CACHE_SIZE = 32
+
+# Instructions prepended to the XML tool examples in the system prompt
+XML_TOOL_CALLING_HEADER = """
+--- XML TOOL CALLING ---
+
+In this environment you have access to a set of tools you can use to answer the user's question. The tools are specified in XML format.
+Format your tool calls using the specified XML tags. Place parameters marked as 'attribute' within the opening tag (e.g., `<tag attribute='value'>`). Place parameters marked as 'content' between the opening and closing tags. Place parameters marked as 'element' within their own child tags (e.g., `<tag><element>value</element></tag>`). Refer to the examples provided below for the exact structure of each tool.
+String and scalar parameters should be specified as attributes, while content goes between tags.
+Note that spaces for string values are not stripped. The output is parsed with regular expressions.
+
+Here are the XML tools available with examples:
+"""
+
 class ThreadManager:
     """Manages conversation threads with LLM models and tool execution.
 
@@ -47,6 +86,8 @@ class ThreadManager:
             target_agent_id: ID of the agent being built (if in agent builder mode)
         """
         self.db = DBConnection()
+        # Messages are stored through the asyncpg pool, like ContextManager reads them
+        self.messages_db = PostgresConnection()
         self.tool_registry = ToolRegistry()
         self.trace = trace
         self.is_agent_builder = is_agent_builder
@@ -61,6 +102,13 @@ class ThreadManager:
             target_agent_id=self.target_agent_id
         )
         self.context_manager = ContextManager()
+        # Message rows waiting to be inserted, each with the future its caller awaits
+        self._pending_messages: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._message_flush_task: Optional[asyncio.Task] = None
+        # (tool registry version, XML examples prompt block) so the block is rebuilt only when tools change
+        self._xml_examples_cache: Tuple[int, str] = (-1, "")
+        # (hash of the system prompt, tool registry version) -> prompt with XML examples appended
+        self._system_prompt_cache: "OrderedDict[Tuple[bytes, int], Dict[str, Any]]" = OrderedDict()
 
     def _is_tool_result_message(self, msg: Dict[str, Any]) -> bool:
         if not ("content" in msg and msg['content']):
@@ -125,7 +173,7 @@ class ThreadManager:
   
     def _compress_tool_result_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: Optional[int] = 1000) -> List[Dict[str, Any]]:
         """Compress the tool result messages except the most recent one."""
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
+        uncompressed_total_token_count = count_message_tokens(llm_model, messages)
 
         if uncompressed_total_token_count > (max_tokens or (100 * 1000)):
             _i = 0 # Count the number of ToolResult messages
@@ -146,7 +194,7 @@ class ThreadManager:
 
     def _compress_user_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: Optional[int] = 1000) -> List[Dict[str, Any]]:
         """Compress the user messages except the most recent one."""
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
+        uncompressed_total_token_count = count_message_tokens(llm_model, messages)
 
         if uncompressed_total_token_count > (max_tokens or (100 * 1000)):
             _i = 0 # Count the number of User messages
@@ -167,7 +215,7 @@ class ThreadManager:
 
     def _compress_assistant_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: Optional[int] = 1000) -> List[Dict[str, Any]]:
         """Compress the assistant messages except the most recent one."""
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
+        uncompressed_total_token_count = count_message_tokens(llm_model, messages)
         if uncompressed_total_token_count > (max_tokens or (100 * 1000)):
             _i = 0 # Count the number of Assistant messages
             for msg in reversed(messages): # Start from the end and work backwards
@@ -231,13 +279,13 @@ class ThreadManager:
         result = messages
         result = self._remove_meta_messages(result)
 
-        uncompressed_total_token_count = token_counter(model=llm_model, messages=result)
+        uncompressed_total_token_count = count_message_tokens(llm_model, result)
 
         result = self._compress_tool_result_messages(result, llm_model, max_tokens, token_threshold)
         result = self._compress_user_messages(result, llm_model, max_tokens, token_threshold)
         result = self._compress_assistant_messages(result, llm_model, max_tokens, token_threshold)
 
-        compressed_token_count = token_counter(model=llm_model, messages=result)
+        compressed_token_count = count_message_tokens(llm_model, result)
 
         logger.info(f"_compress_messages: {uncompressed_total_token_count} -> {compressed_token_count}") # Log the token compression for debugging later
 
@@ -276,7 +324,7 @@ class ThreadManager:
         result = self._remove_meta_messages(result)
 
         # Early exit if no compression needed
-        initial_token_count = token_counter(model=llm_model, messages=result)
+        initial_token_count = count_message_tokens(llm_model, result)
         max_allowed_tokens = max_tokens or (100 * 1000)
         
         if initial_token_count <= max_allowed_tokens:
@@ -313,11 +361,11 @@ class ThreadManager:
 
             # Recalculate token count
             messages_to_count = ([system_message] + conversation_messages) if system_message else conversation_messages
-            current_token_count = token_counter(model=llm_model, messages=messages_to_count)
+            current_token_count = count_message_tokens(llm_model, messages_to_count)
 
         # Prepare final result
         final_messages = ([system_message] + conversation_messages) if system_message else conversation_messages
-        final_token_count = token_counter(model=llm_model, messages=final_messages)
+        final_token_count = count_message_tokens(llm_model, final_messages)
         
         logger.info(f"_compress_messages_by_omitting_messages: {initial_token_count} -> {final_token_count} tokens ({len(messages)} -> {len(final_messages)} messages)")
             
@@ -339,6 +387,17 @@ class ThreadManager:
         """Add a tool to the ThreadManager."""
         self.tool_registry.register_tool(tool_class, function_names, **kwargs)
 
+    async def close_tools(self) -> None:
+        """Release the in-process resources of every registered tool.
+
+        A failure in one tool is logged and does not stop the others from closing.
+        """
+        for tool in self.tool_registry.get_tool_instances():
+            try:
+                await tool.aclose()
+            except Exception as e:
+                logger.error(f"Error closing tool {tool.__class__.__name__}: {str(e)}")
+
     async def add_message(
         self,
         thread_id: str,
@@ -360,7 +419,6 @@ class ThreadManager:
                       Defaults to None, stored as an empty JSONB object if None.
         """
         logger.debug(f"Adding message of type '{type}' to thread {thread_id}")
-        client = await self.db.client
 
         # Prepare data for insertion
         data_to_insert = {
@@ -371,20 +429,90 @@ class ThreadManager:
             'metadata': metadata or {},
         }
 
+        # Queue the row; messages added while an insert is in flight are written
+        # together in the next one instead of one round-trip each
+        future = asyncio.get_running_loop().create_future()
+        self._pending_messages.append((data_to_insert, future))
+        if self._message_flush_task is None or self._message_flush_task.done():
+            self._message_flush_task = asyncio.create_task(self._flush_pending_messages())
+
         try:
-            # Add returning='representation' to get the inserted row data including the id
-            result = await client.table('messages').insert(data_to_insert, returning='representation').execute()
+            inserted = await future
             logger.info(f"Successfully added message to thread {thread_id}")
 
-            if result.data and len(result.data) > 0 and isinstance(result.data[0], dict) and 'message_id' in result.data[0]:
-                return result.data[0]
+            if isinstance(inserted, dict) and 'message_id' in inserted:
+                return inserted
             else:
-                logger.error(f"Insert operation failed or did not return expected data structure for thread {thread_id}. Result data: {result.data}")
+                logger.error(f"Insert operation failed or did not return expected data structure for thread {thread_id}. Result data: {inserted}")
                 return None
         except Exception as e:
             logger.error(f"Failed to add message to thread {thread_id}: {str(e)}", exc_info=True)
             raise
 
+    async def _flush_pending_messages(self) -> None:
+        """Insert queued message rows in batches and resolve their callers' futures.
+
+        Runs until the queue is empty, so rows queued while a batch is being
+        written go out with the next one. Each batch is a single multi-row
+        INSERT through the asyncpg pool. If it fails, its rows are retried one
+        at a time so each caller only sees the error for its own row; rows the
+        failed attempt did write are found by message_id instead of reported
+        as errors.
+        """
+        while self._pending_messages:
+            batch = self._pending_messages[:MAX_MESSAGE_INSERT_BATCH]
+            del self._pending_messages[:MAX_MESSAGE_INSERT_BATCH]
+
+            # Client-side ids let returned rows be matched back to their callers
+            # and make retries idempotent
+            for row, _ in batch:
+                row['message_id'] = str(uuid.uuid4())
+
+            try:
+                inserted = await self._insert_message_rows([row for row, _ in batch])
+            except Exception as e:
+                logger.warning(f"Batch insert of {len(batch)} messages failed, retrying individually: {str(e)}")
+            else:
+                for row, future in batch:
+                    if not future.done():
+                        future.set_result(inserted.get(row['message_id']))
+                continue
+
+            for row, future in batch:
+                try:
+                    inserted = await self._insert_message_rows([row])
+                    stored = inserted.get(row['message_id'])
+                    if stored is None:
+                        # Already written by the failed batch attempt
+                        existing = await self.messages_db.execute_row(
+                            "SELECT * FROM messages WHERE message_id = $1", row['message_id']
+                        )
+                        stored = self._message_record_to_dict(existing) if existing else None
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(stored)
+
+    async def _insert_message_rows(self, rows: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Insert message rows in one statement and return the stored rows by message_id."""
+        records = await self.messages_db.execute(INSERT_MESSAGES_SQL, rows)
+        stored = (self._message_record_to_dict(record) for record in records)
+        return {row['message_id']: row for row in stored}
+
+    @staticmethod
+    def _message_record_to_dict(record) -> Dict[str, Any]:
+        """Convert a messages row to the dict shape callers expect (string ids and timestamps)."""
+        row = dict(record)
+        for key in ('message_id', 'thread_id'):
+            if row.get(key) is not None:
+                row[key] = str(row[key])
+        for key in ('created_at', 'updated_at'):
+            if isinstance(row.get(key), datetime.datetime):
+                row[key] = row[key].isoformat()
+        return row
+
     async def get_llm_messages(self, thread_id: str) -> List[Dict[str, Any]]:
         """Get all messages for a thread.
 
@@ -398,29 +526,46 @@ class ThreadManager:
             List of message objects.
         """
         logger.debug(f"Getting messages for thread {thread_id}")
-        client = await self.db.client
 
         try:
-            # result = await client.rpc('get_llm_formatted_messages', {'p_thread_id': thread_id}).execute()
-            
-            # Fetch messages in batches of 1000 to avoid overloading the database
+            # Fetch messages in batches of 1000 to avoid overloading the database.
+            # Each batch continues after the last (created_at, message_id) seen, so
+            # rows sharing a created_at are neither skipped nor repeated
             all_messages = []
             batch_size = 1000
-            offset = 0
+            cursor = None
             
             while True:
-                result = await client.table('messages').select('message_id, content').eq('thread_id', thread_id).eq('is_llm_message', True).order('created_at').range(offset, offset + batch_size - 1).execute()
+                if cursor is None:
+                    rows = await self.messages_db.execute(
+                        """
+                        SELECT message_id, content, created_at FROM messages
+                        WHERE thread_id = $1 AND is_llm_message = TRUE
+                        ORDER BY created_at, message_id LIMIT $2
+                        """,
+                        thread_id, batch_size,
+                    )
+                else:
+                    rows = await self.messages_db.execute(
+                        """
+                        SELECT message_id, content, created_at FROM messages
+                        WHERE thread_id = $1 AND is_llm_message = TRUE
+                        AND (created_at, message_id) > ($3, $4)
+                        ORDER BY created_at, message_id LIMIT $2
+                        """,
+                        thread_id, batch_size, *cursor,
+                    )
                 
-                if not result.data or len(result.data) == 0:
+                if not rows:
                     break
                     
-                all_messages.extend(result.data)
+                all_messages.extend(rows)
                 
                 # If we got fewer than batch_size records, we've reached the end
-                if len(result.data) < batch_size:
+                if len(rows) < batch_size:
                     break
                     
-                offset += batch_size
+                cursor = (rows[-1]['created_at'], rows[-1]['message_id'])
             
             # Use all_messages instead of result.data in the rest of the method
             result_data = all_messages
@@ -429,19 +574,21 @@ class ThreadManager:
             if not result_data:
                 return []
 
-            # Return properly parsed JSON objects
+            # Return properly parsed JSON objects; the pool's jsonb codec has decoded the
+            # column, so only content stored as a JSON-encoded string needs parsing here
             messages = []
             for item in result_data:
+                message_id = str(item['message_id'])
                 if isinstance(item['content'], str):
                     try:
-                        parsed_item = json.loads(item['content'])
-                        parsed_item['message_id'] = item['message_id']
+                        parsed_item = orjson.loads(item['content'])
+                        parsed_item['message_id'] = message_id
                         messages.append(parsed_item)
-                    except json.JSONDecodeError:
+                    except orjson.JSONDecodeError:
                         logger.error(f"Failed to parse message: {item['content']}")
                 else:
                     content = item['content']
-                    content['message_id'] = item['message_id']
+                    content['message_id'] = message_id
                     messages.append(content)
 
             return messages
@@ -450,6 +597,84 @@ class ThreadManager:
             logger.error(f"Failed to get messages for thread {thread_id}: {str(e)}", exc_info=True)
             return []
 
+    def _get_xml_examples_content(self) -> str:
+        """Get the XML tool examples block for the system prompt.
+
+        The block is cached against the tool registry version, so it is only
+        rebuilt after tools are registered.
+
+        Returns:
+            The header plus one example line per XML tool, or an empty string
+            if no tool has XML examples.
+        """
+        version, content = self._xml_examples_cache
+        if version != self.tool_registry._version:
+            xml_examples = self.tool_registry.get_xml_examples()
+            content = ""
+            if xml_examples:
+                content = XML_TOOL_CALLING_HEADER + "".join(
+                    f"<{tag_name}> Example: {example}\\n"
+                    for tag_name, example in xml_examples.items()
+                )
+            self._xml_examples_cache = (self.tool_registry._version, content)
+        return content
+
+    def _get_augmented_system_prompt(self, system_prompt: Dict[str, Any], examples_content: str) -> Dict[str, Any]:
+        """Get the system prompt with the XML examples appended, reusing earlier results.
+
+        Entries are keyed on the prompt's serialized content, so a caller
+        editing its dict in place gets a fresh result rather than a stale one.
+
+        Args:
+            system_prompt: The caller's system message.
+            examples_content: The XML examples block to append.
+
+        Returns:
+            A system message with the examples appended.
+        """
+        serialized = orjson.dumps(system_prompt, option=orjson.OPT_SORT_KEYS, default=str)
+        key = (hashlib.blake2b(serialized, digest_size=16).digest(), self.tool_registry._version)
+        cached = self._system_prompt_cache.get(key)
+        if cached is not None:
+            self._system_prompt_cache.move_to_end(key)
+            return cached
+
+        augmented = self._build_augmented_system_prompt(system_prompt, examples_content)
+        self._system_prompt_cache[key] = augmented
+        if len(self._system_prompt_cache) > SYSTEM_PROMPT_CACHE_SIZE:
+            self._system_prompt_cache.popitem(last=False)
+        return augmented
+
+    def _build_augmented_system_prompt(self, system_prompt: Dict[str, Any], examples_content: str) -> Dict[str, Any]:
+        """Build a new system message with the XML examples appended to its text.
+
+        Only the dicts on the path to the changed text are copied; the
+        caller's message and content blocks are left untouched.
+
+        Args:
+            system_prompt: The caller's system message.
+            examples_content: The XML examples block to append.
+
+        Returns:
+            A new system message, or the original one if it has no text to append to.
+        """
+        system_content = system_prompt.get('content')
+
+        if isinstance(system_content, str):
+            logger.debug("Appended XML examples to string system prompt content.")
+            return {**system_prompt, 'content': system_content + examples_content}
+        elif isinstance(system_content, list):
+            for index, item in enumerate(system_content):
+                if isinstance(item, dict) and item.get('type') == 'text' and 'text' in item:
+                    new_content = list(system_content)
+                    new_content[index] = {**item, 'text': item['text'] + examples_content}
+                    logger.debug("Appended XML examples to the first text block in list system prompt content.")
+                    return {**system_prompt, 'content': new_content}
+            logger.warning("System prompt content is a list but no text block found to append XML examples.")
+        else:
+            logger.warning(f"System prompt content is of unexpected type ({type(system_content)}), cannot add XML examples.")
+        return system_prompt
+
     async def run_thread(
         self,
         thread_id: str,
@@ -468,6 +693,7 @@ class ThreadManager:
         reasoning_effort: Optional[str] = 'low',
         enable_context_manager: bool = True,
         generation: Optional[StatefulGenerationClient] = None,
+        optimize_prefix_cache: bool = True,
     ) -> Union[Dict[str, Any], AsyncGenerator]:
         """Run a conversation thread with LLM integration and tool execution.
 
@@ -488,6 +714,9 @@ class ThreadManager:
             enable_thinking: Whether to enable thinking before making a decision
             reasoning_effort: The effort level for reasoning
             enable_context_manager: Whether to enable automatic context summarization.
+            optimize_prefix_cache: Append the temporary message after the thread history
+                                   instead of before the last user message, so each call's
+                                   prompt extends the previous one and provider prefix caching applies
 
         Returns:
             An async generator yielding response chunks or error dict
@@ -506,26 +735,13 @@ class ThreadManager:
         if max_xml_tool_calls > 0 and not processor_config.max_xml_tool_calls:
             processor_config.max_xml_tool_calls = max_xml_tool_calls
 
-        # Create a working copy of the system prompt to potentially modify
-        working_system_prompt = system_prompt.copy()
+        # XML examples go into a new dict rather than the caller's system prompt
+        working_system_prompt = system_prompt
 
         # Add XML examples to system prompt if requested, do this only ONCE before the loop
         if include_xml_examples and processor_config.xml_tool_calling:
-            xml_examples = self.tool_registry.get_xml_examples()
-            if xml_examples:
-                examples_content = """
---- XML TOOL CALLING ---
-
-In this environment you have access to a set of tools you can use to answer the user's question. The tools are specified in XML format.
-Format your tool calls using the specified XML tags. Place parameters marked as 'attribute' within the opening tag (e.g., `<tag attribute='value'>`). Place parameters marked as 'content' between the opening and closing tags. Place parameters marked as 'element' within their own child tags (e.g., `<tag><element>value</element></tag>`). Refer to the examples provided below for the exact structure of each tool.
-String and scalar parameters should be specified as attributes, while content goes between tags.
-Note that spaces for string values are not stripped. The output is parsed with regular expressions.
-
-Here are the XML tools available with examples:
-"""
-                for tag_name, example in xml_examples.items():
-                    examples_content += f"<{tag_name}> Example: {example}\\n"
-
+            examples_content = self._get_xml_examples_content()
+            if examples_content:
                 # # Save examples content to a file
                 # try:
                 #     with open('xml_examples.txt', 'w') as f:
@@ -534,23 +750,7 @@ Here are the XML tools available with examples:
                 # except Exception as e:
                 #     logger.error(f"Failed to save XML examples to file: {e}")
 
-                system_content = working_system_prompt.get('content')
-
-                if isinstance(system_content, str):
-                    working_system_prompt['content'] += examples_content
-                    logger.debug("Appended XML examples to string system prompt content.")
-                elif isinstance(system_content, list):
-                    appended = False
-                    for item in working_system_prompt['content']: # Modify the copy
-                        if isinstance(item, dict) and item.get('type') == 'text' and 'text' in item:
-                            item['text'] += examples_content
-                            logger.debug("Appended XML examples to the first text block in list system prompt content.")
-                            appended = True
-                            break
-                    if not appended:
-                        logger.warning("System prompt content is a list but no text block found to append XML examples.")
-                else:
-                    logger.warning(f"System prompt content is of unexpected type ({type(system_content)}), cannot add XML examples.")
+                working_system_prompt = self._get_augmented_system_prompt(system_prompt, examples_content)
         # Control whether we need to auto-continue due to tool_calls finish reason
         auto_continue = True
         auto_continue_count = 0
@@ -568,8 +768,9 @@ Here are the XML tools available with examples:
                 # 2. Check token count before proceeding
                 token_count = 0
                 try:
-                    # Use the potentially modified working_system_prompt for token counting
-                    token_count = token_counter(model=llm_model, messages=[working_system_prompt] + messages)
+                    # Use the potentially modified working_system_prompt for token counting;
+                    # per-message counts are cached, so on auto-continue only new messages are tokenized
+                    token_count = count_message_tokens(llm_model, [working_system_prompt] + messages)
                     token_threshold = self.context_manager.token_threshold
                     logger.info(f"Thread {thread_id} token count: {token_count}/{token_threshold} ({(token_count/token_threshold)*100:.1f}%)")
 
@@ -597,16 +798,19 @@ Here are the XML tools available with examples:
 
                 # 3. Prepare messages for LLM call + add temporary message if it exists
                 # Use the working_system_prompt which may contain the XML examples
-                prepared_messages = [working_system_prompt]
+                # Fresh copy per call: working_system_prompt may be the caller's dict or a cached one
+                prepared_messages = [{**working_system_prompt}]
 
-                # Find the last user message index
+                # Find the last user message index (only needed when not keeping a stable prefix)
                 last_user_index = -1
-                for i, msg in enumerate(messages):
-                    if msg.get('role') == 'user':
-                        last_user_index = i
-
-                # Insert temporary message before the last user message if it exists
-                if temp_msg and last_user_index >= 0:
+                if temp_msg and not optimize_prefix_cache:
+                    for i, msg in enumerate(messages):
+                        if msg.get('role') == 'user':
+                            last_user_index = i
+
+                # Insert temporary message before the last user message if it exists,
+                # unless the history is kept as a stable prefix for provider caching
+                if temp_msg and last_user_index >= 0 and not optimize_prefix_cache:
                     prepared_messages.extend(messages[:last_user_index])
                     prepared_messages.append(temp_msg)
                     prepared_messages.extend(messages[last_user_index:])
@@ -101,13 +101,37 @@ class Tool(ABC):
     
     Attributes:
         _schemas (Dict[str, List[ToolSchema]]): Registered schemas for tool methods
+        _class_schemas (Dict[str, List[ToolSchema]]): Schemas collected once per tool class
         
     Methods:
         get_schemas: Get all registered tool schemas
         success_response: Create a successful result
         fail_response: Create a failed result
+        aclose: Release client-side resources when the agent run ends
     """
-    
+
+    _class_schemas: Dict[str, List[ToolSchema]] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        """Collect the decorated method schemas once when a tool class is defined.
+
+        The schema decorators run at import time and the resulting schemas are
+        identical for every instance, so instances only copy this table instead
+        of re-inspecting all of their members.
+        """
+        super().__init_subclass__(**kwargs)
+        cls._class_schemas = cls._collect_class_schemas()
+
+    @classmethod
+    def _collect_class_schemas(cls) -> Dict[str, List[ToolSchema]]:
+        """Find all methods on the class (including inherited ones) that carry schemas."""
+        schemas: Dict[str, List[ToolSchema]] = {}
+        for name in sorted(dir(cls)):
+            attr = inspect.getattr_static(cls, name)
+            if inspect.isfunction(attr) and hasattr(attr, 'tool_schemas'):
+                schemas[name] = attr.tool_schemas
+        return schemas
+
     def __init__(self):
         """Initialize tool with empty schema registry."""
         self._schemas: Dict[str, List[ToolSchema]] = {}
@@ -116,10 +140,8 @@ class Tool(ABC):
 
     def _register_schemas(self):
         """Register schemas from all decorated methods."""
-        for name, method in inspect.getmembers(self, predicate=inspect.ismethod):
-            if hasattr(method, 'tool_schemas'):
-                self._schemas[name] = method.tool_schemas
-                logger.debug(f"Registered schemas for method '{name}' in {self.__class__.__name__}")
+        self._schemas.update(self._class_schemas)
+        logger.debug(f"Registered schemas for methods {list(self._class_schemas)} in {self.__class__.__name__}")
 
     def get_schemas(self) -> Dict[str, List[ToolSchema]]:
         """Get all registered tool schemas.
@@ -157,6 +179,14 @@ class Tool(ABC):
         logger.debug(f"Tool {self.__class__.__name__} returned failed result: {msg}")
         return ToolResult(success=False, output=msg)
 
+    async def aclose(self) -> None:
+        """Release resources the tool holds in this process, such as HTTP clients.
+
+        Called once when the agent run that registered the tool ends. State the
+        tool created in the sandbox (sessions, files) must outlive the run, so it
+        is not touched here.
+        """
+
 def _add_schema(func, schema: ToolSchema):
     """Helper to add schema to a function."""
     if not hasattr(func, 'tool_schemas'):
@@ -1,5 +1,5 @@
-from typing import Dict, Type, Any, List, Optional, Callable
-from agentpress.tool import Tool, SchemaType
+from typing import Dict, Type, Any, List, Optional, Callable, Tuple
+from agentpress.tool import Tool, SchemaType, ToolSchema
 from utils.logger import logger
 
 
@@ -15,6 +15,7 @@ class ToolRegistry:
         
     Methods:
         register_tool: Register a tool with optional function filtering
+        register_function: Register a single runtime-discovered function
         get_tool: Get a specific tool by name
         get_xml_tool: Get a tool by XML tag name
         get_openapi_schemas: Get OpenAPI schemas for function calling
@@ -25,6 +26,9 @@ class ToolRegistry:
         """Initialize a new ToolRegistry instance."""
         self.tools = {}
         self.xml_tools = {}
+        # Bumped on every registration so derived views can be cached between changes
+        self._version = 0
+        self._openapi_schemas_cache: Tuple[int, List[Dict[str, Any]]] = (-1, [])
         logger.debug("Initialized new ToolRegistry instance")
     
     def register_tool(self, tool_class: Type[Tool], function_names: Optional[List[str]] = None, **kwargs):
@@ -68,8 +72,26 @@ class ToolRegistry:
                         registered_xml += 1
                         logger.debug(f"Registered XML tag {schema.xml_schema.tag_name} -> {func_name} from {tool_class.__name__}")
         
+        self._version += 1
         logger.debug(f"Tool registration complete for {tool_class.__name__}: {registered_openapi} OpenAPI functions, {registered_xml} XML tags")
 
+    def register_function(self, func_name: str, tool_instance: Tool, schema: ToolSchema):
+        """Register a single OpenAPI function on an already registered tool instance.
+
+        Used for tools that discover their functions at runtime (e.g. MCP servers).
+
+        Args:
+            func_name: Name of the function
+            tool_instance: Tool instance that implements the function
+            schema: OpenAPI schema for the function
+        """
+        self.tools[func_name] = {
+            "instance": tool_instance,
+            "schema": schema
+        }
+        self._version += 1
+        logger.debug(f"Registered OpenAPI function {func_name} from {tool_instance.__class__.__name__}")
+
     def get_available_functions(self) -> Dict[str, Callable]:
         """Get all available tool functions.
         
@@ -95,6 +117,17 @@ class ToolRegistry:
         logger.debug(f"Retrieved {len(available_functions)} available functions")
         return available_functions
 
+    def get_tool_instances(self) -> List[Tool]:
+        """Get each registered tool instance once, in registration order.
+        
+        Returns:
+            List of tool instances behind the OpenAPI functions and XML tags
+        """
+        instances = {}
+        for entry in (*self.tools.values(), *self.xml_tools.values()):
+            instances.setdefault(id(entry["instance"]), entry["instance"])
+        return list(instances.values())
+
     def get_tool(self, tool_name: str) -> Dict[str, Any]:
         """Get a specific tool by name.
         
@@ -129,11 +162,14 @@ class ToolRegistry:
         Returns:
             List of OpenAPI-compatible schema definitions
         """
-        schemas = [
-            tool_info['schema'].schema 
-            for tool_info in self.tools.values()
-            if tool_info['schema'].schema_type == SchemaType.OPENAPI
-        ]
+        version, schemas = self._openapi_schemas_cache
+        if version != self._version:
+            schemas = [
+                tool_info['schema'].schema 
+                for tool_info in self.tools.values()
+                if tool_info['schema'].schema_type == SchemaType.OPENAPI
+            ]
+            self._openapi_schemas_cache = (self._version, schemas)
         logger.debug(f"Retrieved {len(schemas)} OpenAPI schemas")
         return schemas
 
@@ -5,12 +5,33 @@ Centralized database connection management for Yeti AI using Neon (PostgreSQL).
 import os
 from typing import Optional
 import asyncpg
+import orjson
 from utils.logger import logger
 from utils.config import config  # Assuming this loads DATABASE_URL
 import base64
 import uuid
 from datetime import datetime
 
+def _encode_jsonb(value) -> str:
+    """Serialize a Python value for a jsonb parameter (a str becomes a JSON string)."""
+    return orjson.dumps(value, default=str).decode()
+
+
+async def _init_connection(connection: asyncpg.Connection) -> None:
+    """Set up each pooled connection so json/jsonb values map to Python objects.
+
+    Without a codec asyncpg hands jsonb back as raw JSON text, so a value
+    stored as a JSON string would arrive still quoted and escaped.
+    """
+    for type_name in ('json', 'jsonb'):
+        await connection.set_type_codec(
+            type_name,
+            encoder=_encode_jsonb,
+            decoder=orjson.loads,
+            schema='pg_catalog',
+        )
+
+
 class DBConnection:
     """Singleton database connection manager using asyncpg for PostgreSQL."""
 
@@ -37,7 +58,11 @@ class DBConnection:
 
             logger.debug("Initializing PostgreSQL connection pool")
             # Adjust connection options as needed, e.g., min/max_size, timeouts
-            self._pool = await asyncpg.create_pool(dsn=db_url, min_size=1, max_size=10)
+            # statement_cache_size=0: transaction-mode poolers (Supabase :6543, Neon
+            # pooled endpoints, PgBouncer) hand each transaction to an arbitrary
+            # server connection, so asyncpg's cached prepared statements would
+            # fail with 'prepared statement "__asyncpg_stmt_X__" does not exist'.
+            self._pool = await asyncpg.create_pool(dsn=db_url, min_size=1, max_size=10, statement_cache_size=0, init=_init_connection)
             self._initialized = True
             logger.debug("Database connection pool initialized with PostgreSQL (Neon)")
         except Exception as e:
@@ -163,4 +188,3 @@ class DBConnection:
 # if __name__ == "__main__":
 #     import asyncio
 #     asyncio.run(main())
-[end of backend/services/database.py]
@@ -163,26 +163,32 @@ def prepare_params(
     # Check model name *after* potential modifications (like adding bedrock/ prefix)
     effective_model_name = params.get("model", model_name) # Use model from params if set, else original
     if "claude" in effective_model_name.lower() or "anthropic" in effective_model_name.lower():
-        messages = params["messages"] # Direct reference, modification affects params
+        messages = params["messages"]
 
         # Ensure messages is a list
         if not isinstance(messages, list):
             return params # Return early if messages format is unexpected
 
+        # Work on a copy of the list; messages and content blocks that get cache_control
+        # are replaced with copies so the caller's dicts are never modified
+        messages = params["messages"] = list(messages)
+
         # 1. Process the first message if it's a system prompt with string content
         if messages and messages[0].get("role") == "system":
             content = messages[0].get("content")
             if isinstance(content, str):
                 # Wrap the string content in the required list structure
-                messages[0]["content"] = [
+                messages[0] = {**messages[0], "content": [
                     {"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}
-                ]
+                ]}
             elif isinstance(content, list):
                  # If content is already a list, check if the first text block needs cache_control
-                 for item in content:
+                 for i, item in enumerate(content):
                      if isinstance(item, dict) and item.get("type") == "text":
                          if "cache_control" not in item:
-                             item["cache_control"] = {"type": "ephemeral"}
+                             content = list(content)
+                             content[i] = {**item, "cache_control": {"type": "ephemeral"}}
+                             messages[0] = {**messages[0], "content": content}
                              break # Apply to the first text block only for system prompt
 
         # 2. Find and process relevant user and assistant messages (limit to 4 max)
@@ -215,14 +221,16 @@ def prepare_params(
             content = message.get("content")
 
             if isinstance(content, str):
-                message["content"] = [
+                messages[message_idx] = {**message, "content": [
                     {"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}
-                ]
+                ]}
             elif isinstance(content, list):
-                for item in content:
-                    if isinstance(item, dict) and item.get("type") == "text":
-                        if "cache_control" not in item:
-                           item["cache_control"] = {"type": "ephemeral"}
+                messages[message_idx] = {**message, "content": [
+                    {**item, "cache_control": {"type": "ephemeral"}}
+                    if isinstance(item, dict) and item.get("type") == "text" and "cache_control" not in item
+                    else item
+                    for item in content
+                ]}
 
         # Apply cache control to the identified messages (max 4: system, last user, second last user, last assistant)
         # System message is always at index 0 if present
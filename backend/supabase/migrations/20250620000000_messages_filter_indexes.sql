@@ -0,0 +1,16 @@
+BEGIN;
+
+-- Message lookups always filter on thread_id plus type and/or is_llm_message
+-- and then order by created_at (latest summary, latest image_context, LLM
+-- history since the last summary). With only single-column indexes on
+-- thread_id and created_at, Postgres reads every row of the thread and
+-- filters afterwards. These composite indexes let the planner resolve the
+-- whole WHERE clause and the ORDER BY from the index.
+CREATE INDEX IF NOT EXISTS idx_messages_thread_type_created_at
+    ON messages(thread_id, type, created_at DESC);
+
+CREATE INDEX IF NOT EXISTS idx_messages_thread_llm_created_at
+    ON messages(thread_id, created_at)
+    WHERE is_llm_message = TRUE;
+
+COMMIT;
@@ -0,0 +1,10 @@
+import importlib.util
+import sys
+import types
+
+# agentpress.thread_manager still imports the supabase client module for its other
+# callers; it is not part of this tree, and message storage goes through the asyncpg pool
+if 'services.supabase' not in sys.modules and importlib.util.find_spec('services.supabase') is None:
+    supabase_stub = types.ModuleType('services.supabase')
+    supabase_stub.DBConnection = type('DBConnection', (), {})
+    sys.modules['services.supabase'] = supabase_stub
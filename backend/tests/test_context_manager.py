@@ -0,0 +1,252 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import litellm
+import pytest
+
+from agentpress import context_manager
+from agentpress.context_manager import ContextManager
+from services import database
+
+BASE_TIME = datetime(2025, 6, 1, tzinfo=timezone.utc)
+
+
+def _row(seconds, type, content, message_id=None):
+    return {
+        'message_id': message_id or uuid.uuid4(),
+        'thread_id': 'thread-1',
+        'type': type,
+        'is_llm_message': True,
+        'content': content,
+        'created_at': BASE_TIME + timedelta(seconds=seconds),
+    }
+
+
+class FakeMessagesDB:
+    """Answers the summarization queries from in-memory rows, as the asyncpg pool would."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.page_queries = 0
+
+    async def execute_val(self, query, thread_id):
+        assert "type = 'summary'" in query
+        return max((r['created_at'] for r in self.rows if r['type'] == 'summary'), default=None)
+
+    async def execute(self, query, thread_id, *args):
+        self.page_queries += 1
+        args = list(args)
+        limit = args.pop()
+        candidates = [r for r in self.rows if r['thread_id'] == thread_id and r['type'] != 'summary']
+        if '::text::timestamptz' in query:
+            since = datetime.fromisoformat(args.pop(0))
+            candidates = [r for r in candidates if r['created_at'] > since]
+        if '(created_at, message_id) >' in query:
+            cursor = (args[0], args[1])
+            candidates = [r for r in candidates if (r['created_at'], r['message_id']) > cursor]
+        candidates.sort(key=lambda r: (r['created_at'], r['message_id']))
+        return candidates[:limit]
+
+
+@pytest.fixture
+def manager():
+    return ContextManager()
+
+
+@pytest.mark.asyncio
+async def test_paging_keeps_rows_that_share_created_at(manager, monkeypatch):
+    monkeypatch.setattr(context_manager, 'MESSAGE_PAGE_SIZE', 2)
+    ids = sorted(uuid.uuid4() for _ in range(5))
+    # Five rows written in one batch with the same created_at straddle the page boundaries
+    rows = [_row(0, 'user', {'role': 'user', 'content': f'm{i}'}, message_id=ids[i]) for i in range(5)]
+    manager.db = FakeMessagesDB(rows)
+
+    messages = await manager.get_messages_for_summarization('thread-1')
+
+    assert [m['content'] for m in messages] == ['m0', 'm1', 'm2', 'm3', 'm4']
+    assert manager.db.page_queries == 3
+
+
+@pytest.mark.asyncio
+async def test_only_messages_after_latest_summary_are_returned(manager):
+    manager.db = FakeMessagesDB([
+        _row(0, 'user', {'role': 'user', 'content': 'before'}),
+        _row(1, 'summary', {'role': 'user', 'content': 'summary'}),
+        _row(2, 'assistant', {'role': 'assistant', 'content': 'after'}),
+    ])
+
+    messages = await manager.get_messages_for_summarization('thread-1')
+
+    assert messages == [{'role': 'assistant', 'content': 'after'}]
+    assert manager._last_summary_times['thread-1'] == str(BASE_TIME + timedelta(seconds=1))
+
+
+class FakeConnection:
+    def __init__(self):
+        self.codecs = {}
+
+    async def set_type_codec(self, type_name, encoder, decoder, schema):
+        self.codecs[type_name] = (encoder, decoder)
+
+
+@pytest.mark.asyncio
+async def test_jsonb_string_rows_are_decoded_to_messages(manager):
+    connection = FakeConnection()
+    await database._init_connection(connection)
+    _, decode_jsonb = connection.codecs['jsonb']
+
+    # json.dumps(...) callers store the message as a jsonb *string*; this is its raw wire text
+    raw = '"{\\"role\\": \\"user\\", \\"content\\": \\"hello\\"}"'
+    manager.db = FakeMessagesDB([
+        _row(0, 'user', decode_jsonb(raw)),
+        _row(1, 'assistant', decode_jsonb('{"role": "assistant", "content": "hi"}')),
+        _row(2, 'user', decode_jsonb('"plain text"')),
+    ])
+
+    messages = await manager.get_messages_for_summarization('thread-1')
+
+    assert messages == [
+        {'role': 'user', 'content': 'hello'},
+        {'role': 'assistant', 'content': 'hi'},
+        {'role': 'user', 'content': 'plain text'},
+    ]
+
+
+@pytest.fixture
+def fake_token_counter(monkeypatch):
+    """Replace litellm's counter with one that charges 3 tokens per request,
+    4 per message and 1 per word, and start from empty token caches."""
+    calls = []
+
+    def token_counter(model, messages):
+        calls.append((model, messages))
+        return 3 + sum(4 + len(str(m.get('content', '')).split()) for m in messages)
+
+    monkeypatch.setattr(context_manager, 'token_counter', token_counter)
+    monkeypatch.setattr(context_manager, '_message_token_cache', context_manager.OrderedDict())
+    monkeypatch.setattr(context_manager, '_request_overhead_tokens', {})
+    return calls
+
+
+def _words(n):
+    return ' '.join(['word'] * n)
+
+
+def test_fast_estimate_counts_text_and_tool_call_arguments():
+    messages = [
+        {'role': 'user', 'content': 'x' * 400},
+        {'role': 'assistant', 'content': '', 'tool_calls': [{'function': {'arguments': 'y' * 400}}]},
+    ]
+
+    estimate = context_manager._fast_token_estimate(messages)
+
+    assert 200 <= estimate < 240
+
+
+def test_fast_estimate_charges_base64_images_a_flat_cost():
+    image_data = 'A' * 2_000_000
+    message = {'role': 'user', 'content': [
+        {'type': 'text', 'text': 'What is in this screenshot?'},
+        {'type': 'image_url', 'image_url': {'url': f'data:image/jpeg;base64,{image_data}'}},
+    ]}
+
+    estimate = context_manager._fast_token_estimate([message])
+
+    assert context_manager.IMAGE_TOKEN_ESTIMATE <= estimate < context_manager.IMAGE_TOKEN_ESTIMATE + 50
+
+
+def test_fast_estimate_charges_bare_data_urls_a_flat_cost():
+    estimate = context_manager._fast_token_estimate(['data:image/png;base64,' + 'A' * 2_000_000])
+
+    assert estimate == context_manager.IMAGE_TOKEN_ESTIMATE
+
+
+def test_recent_messages_are_kept_until_the_budget_is_spent(fake_token_counter):
+    messages = [{'role': 'user', 'content': _words(10)} for _ in range(5)]
+
+    # 14 tokens each once the per-request overhead is taken off
+    assert context_manager._count_recent_within_budget(messages, 30) == 2
+    assert context_manager._count_recent_within_budget(messages, 70) == 5
+
+
+def test_newest_message_is_kept_even_over_budget(fake_token_counter):
+    messages = [{'role': 'user', 'content': _words(10)}, {'role': 'user', 'content': _words(50)}]
+
+    assert context_manager._count_recent_within_budget(messages, 5) == 1
+
+
+def test_count_matches_litellm_for_plain_messages(monkeypatch):
+    monkeypatch.setattr(context_manager, '_message_token_cache', context_manager.OrderedDict())
+    monkeypatch.setattr(context_manager, '_request_overhead_tokens', {})
+    messages = [
+        {'role': 'system', 'content': 'You are a helpful assistant.'},
+        {'role': 'user', 'content': 'hello there, how are you?'},
+        {'role': 'assistant', 'content': 'Fine, thanks.'},
+    ]
+
+    assert context_manager.count_message_tokens('gpt-4', messages) == litellm.token_counter(model='gpt-4', messages=messages)
+
+
+def test_request_overhead_is_probed_once_per_model(fake_token_counter):
+    assert context_manager._get_request_overhead_tokens('gpt-4') == 3
+    assert context_manager._get_request_overhead_tokens('gpt-4') == 3
+    assert len(fake_token_counter) == 2
+
+    context_manager._get_request_overhead_tokens('claude-3')
+    assert len(fake_token_counter) == 4
+
+
+def test_count_matches_whole_request_count(fake_token_counter):
+    messages = [
+        {'role': 'user', 'content': _words(7)},
+        {'role': 'assistant', 'content': _words(12)},
+        {'role': 'user', 'content': ''},
+    ]
+
+    assert context_manager.count_message_tokens('gpt-4', messages) == 3 + 11 + 16 + 4
+
+
+def test_growing_thread_only_tokenizes_new_messages(fake_token_counter):
+    history = [{'role': 'user', 'content': _words(i + 1)} for i in range(3)]
+    context_manager.count_message_tokens('gpt-4', history)
+    probes_and_first_pass = len(fake_token_counter)
+
+    history.append({'role': 'assistant', 'content': _words(5)})
+    total = context_manager.count_message_tokens('gpt-4', history)
+
+    assert len(fake_token_counter) == probes_and_first_pass + 1
+    assert fake_token_counter[-1][1] == [history[-1]]
+    assert total == 3 + 5 + 6 + 7 + 9
+
+
+def test_cache_is_keyed_on_content_and_model(fake_token_counter):
+    message = {'role': 'user', 'content': _words(3)}
+    context_manager.count_message_tokens('gpt-4', [message])
+    calls = len(fake_token_counter)
+
+    # Same content in a new dict (with keys in another order) is a cache hit
+    context_manager.count_message_tokens('gpt-4', [{'content': _words(3), 'role': 'user'}])
+    assert len(fake_token_counter) == calls
+
+    message['content'] = _words(4)
+    assert context_manager.count_message_tokens('gpt-4', [message]) == 3 + 8
+    assert len(fake_token_counter) == calls + 1
+
+    # Another model has its own overhead probe and per-message counts
+    context_manager.count_message_tokens('claude-3', [message])
+    assert len(fake_token_counter) == calls + 4
+
+
+def test_cache_evicts_least_recently_used_entries(fake_token_counter, monkeypatch):
+    monkeypatch.setattr(context_manager, 'MESSAGE_TOKEN_CACHE_SIZE', 2)
+    first, second, third = ({'role': 'user', 'content': _words(n)} for n in (1, 2, 3))
+
+    context_manager.count_message_tokens('gpt-4', [first, second])
+    context_manager.count_message_tokens('gpt-4', [first])  # refresh first
+    context_manager.count_message_tokens('gpt-4', [third])  # evicts second
+    calls = len(fake_token_counter)
+
+    context_manager.count_message_tokens('gpt-4', [first, third])
+    assert len(fake_token_counter) == calls
+    context_manager.count_message_tokens('gpt-4', [second])
+    assert len(fake_token_counter) == calls + 1
@@ -0,0 +1,95 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from agentpress.thread_manager import ThreadManager, INSERT_MESSAGES_SQL
+
+MISSING_THREAD_ID = str(uuid.uuid4())
+
+
+class ForeignKeyViolation(Exception):
+    pass
+
+
+class FakeMessagesPool:
+    """Stands in for the asyncpg pool: one INSERT statement is all-or-nothing,
+    created_at comes from a single ordered database clock, and message_id is unique."""
+
+    def __init__(self):
+        self.rows = {}
+        self.statements = 0
+        self.timeout_after_commit = False
+        self._clock = datetime(2025, 6, 1, tzinfo=timezone.utc)
+
+    async def execute(self, query, batch):
+        assert query == INSERT_MESSAGES_SQL
+        self.statements += 1
+        if any(row['thread_id'] == MISSING_THREAD_ID for row in batch):
+            raise ForeignKeyViolation('insert or update on table "messages" violates foreign key constraint')
+        stored = []
+        for row in batch:
+            if row['message_id'] in self.rows:
+                continue  # ON CONFLICT (message_id) DO NOTHING
+            self._clock += timedelta(microseconds=1)
+            record = {**row, 'message_id': uuid.UUID(row['message_id']), 'created_at': self._clock}
+            self.rows[row['message_id']] = record
+            stored.append(record)
+        if self.timeout_after_commit:
+            self.timeout_after_commit = False
+            raise asyncio.TimeoutError()
+        return stored
+
+    async def execute_row(self, query, message_id):
+        return self.rows.get(message_id)
+
+
+@pytest.fixture
+def thread_manager():
+    tm = ThreadManager()
+    tm.messages_db = FakeMessagesPool()
+    return tm
+
+
+@pytest.mark.asyncio
+async def test_concurrent_messages_keep_call_order(thread_manager):
+    results = await asyncio.gather(*(
+        thread_manager.add_message("thread-1", "assistant", {"index": i}, is_llm_message=True)
+        for i in range(5)
+    ))
+
+    assert thread_manager.messages_db.statements == 1
+    assert [r['content']['index'] for r in results] == list(range(5))
+    created = [r['created_at'] for r in results]
+    assert created == sorted(created) and len(set(created)) == 5
+    assert all(isinstance(r['message_id'], str) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_failed_row_only_fails_its_own_caller(thread_manager):
+    results = await asyncio.gather(
+        thread_manager.add_message("thread-1", "assistant", {"index": 0}, is_llm_message=True),
+        thread_manager.add_message(MISSING_THREAD_ID, "tool", {"index": 1}, is_llm_message=True),
+        thread_manager.add_message("thread-1", "tool", {"index": 2}, is_llm_message=True),
+        return_exceptions=True,
+    )
+
+    assert isinstance(results[1], ForeignKeyViolation)
+    assert results[0]['content'] == {"index": 0}
+    assert results[2]['content'] == {"index": 2}
+    assert results[0]['created_at'] < results[2]['created_at']
+    assert [r['content']['index'] for r in thread_manager.messages_db.rows.values()] == [0, 2]
+
+
+@pytest.mark.asyncio
+async def test_batch_committed_before_client_error_is_not_reported_as_failed(thread_manager):
+    thread_manager.messages_db.timeout_after_commit = True
+
+    results = await asyncio.gather(*(
+        thread_manager.add_message("thread-1", "assistant", {"index": i}, is_llm_message=True)
+        for i in range(3)
+    ))
+
+    assert [r['content']['index'] for r in results] == [0, 1, 2]
+    assert len(thread_manager.messages_db.rows) == 3
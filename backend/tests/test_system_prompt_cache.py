@@ -0,0 +1,49 @@
+import pytest
+
+from agentpress.thread_manager import ThreadManager
+
+EXAMPLES = "\n<examples/>"
+
+
+@pytest.fixture
+def thread_manager():
+    return ThreadManager()
+
+
+def test_same_prompt_reuses_augmented_result(thread_manager):
+    first = thread_manager._get_augmented_system_prompt({"role": "system", "content": "Be brief."}, EXAMPLES)
+    second = thread_manager._get_augmented_system_prompt({"role": "system", "content": "Be brief."}, EXAMPLES)
+
+    assert second is first
+    assert first["content"] == "Be brief." + EXAMPLES
+
+
+def test_prompt_edited_in_place_is_rebuilt(thread_manager):
+    system_prompt = {"role": "system", "content": "Be brief."}
+    thread_manager._get_augmented_system_prompt(system_prompt, EXAMPLES)
+
+    system_prompt["content"] = "Be thorough."
+    augmented = thread_manager._get_augmented_system_prompt(system_prompt, EXAMPLES)
+
+    assert augmented["content"] == "Be thorough." + EXAMPLES
+
+
+def test_list_content_block_edited_in_place_is_rebuilt(thread_manager):
+    system_prompt = {"role": "system", "content": [{"type": "text", "text": "Be brief."}]}
+    thread_manager._get_augmented_system_prompt(system_prompt, EXAMPLES)
+
+    system_prompt["content"][0]["text"] = "Be thorough."
+    augmented = thread_manager._get_augmented_system_prompt(system_prompt, EXAMPLES)
+
+    assert augmented["content"][0]["text"] == "Be thorough." + EXAMPLES
+    assert system_prompt["content"][0]["text"] == "Be thorough."
+
+
+def test_tool_registry_change_invalidates_cache(thread_manager):
+    system_prompt = {"role": "system", "content": "Be brief."}
+    thread_manager._get_augmented_system_prompt(system_prompt, EXAMPLES)
+
+    thread_manager.tool_registry._version += 1
+    augmented = thread_manager._get_augmented_system_prompt(system_prompt, "\n<other/>")
+
+    assert augmented["content"] == "Be brief.\n<other/>"
@@ -0,0 +1,62 @@
+import pytest
+
+from agentpress.thread_manager import ThreadManager
+from agentpress.tool import Tool, openapi_schema, xml_schema
+
+
+class ClosingTool(Tool):
+    def __init__(self, closed):
+        super().__init__()
+        self.closed = closed
+
+    @openapi_schema({"type": "function", "function": {"name": "first", "parameters": {}}})
+    @xml_schema(tag_name="first")
+    async def first(self):
+        return self.success_response("first")
+
+    @openapi_schema({"type": "function", "function": {"name": "second", "parameters": {}}})
+    async def second(self):
+        return self.success_response("second")
+
+    async def aclose(self):
+        self.closed.append(self)
+
+
+class FailingTool(Tool):
+    @openapi_schema({"type": "function", "function": {"name": "failing", "parameters": {}}})
+    async def failing(self):
+        return self.success_response("failing")
+
+    async def aclose(self):
+        raise RuntimeError("close failed")
+
+
+class PlainTool(Tool):
+    @openapi_schema({"type": "function", "function": {"name": "plain", "parameters": {}}})
+    async def plain(self):
+        return self.success_response("plain")
+
+
+@pytest.mark.asyncio
+async def test_each_registered_tool_is_closed_once():
+    closed = []
+    thread_manager = ThreadManager()
+    thread_manager.add_tool(ClosingTool, closed=closed)
+    thread_manager.add_tool(PlainTool)
+
+    await thread_manager.close_tools()
+
+    assert len(closed) == 1
+    assert len(thread_manager.tool_registry.get_tool_instances()) == 2
+
+
+@pytest.mark.asyncio
+async def test_failing_tool_does_not_stop_the_others_closing():
+    closed = []
+    thread_manager = ThreadManager()
+    thread_manager.add_tool(FailingTool)
+    thread_manager.add_tool(ClosingTool, closed=closed)
+
+    await thread_manager.close_tools()
+
+    assert len(closed) == 1
@@ -147,6 +147,7 @@ class Configuration:
     CLOUDFLARE_API_TOKEN: Optional[str] = None
     FIRECRAWL_API_KEY: str
     FIRECRAWL_URL: Optional[str] = "https://api.firecrawl.dev"
+    SCRAPE_CONCURRENCY: int = 8  # Max Firecrawl scrapes in flight per tool instance
     
     # Stripe configuration
     STRIPE_SECRET_KEY: Optional[str] = None
@@ -2,7 +2,8 @@ import structlog, logging, os
 
 ENV_MODE = os.getenv("ENV_MODE", "LOCAL")
 
-renderer = [structlog.processors.JSONRenderer()]
+# ConsoleRenderer formats exc_info itself and fails on the dicts dict_tracebacks produces
+renderer = [structlog.processors.dict_tracebacks, structlog.processors.JSONRenderer()]
 if ENV_MODE.lower() == "local".lower():
     renderer = [structlog.dev.ConsoleRenderer()]
 
@@ -10,7 +11,6 @@ structlog.configure(
     processors=[
         structlog.stdlib.add_log_level,
         structlog.stdlib.PositionalArgumentsFormatter(),
-        structlog.processors.dict_tracebacks,
         structlog.processors.CallsiteParameterAdder(
             {
                 structlog.processors.CallsiteParameter.FILENAME,